@@ -0,0 +1,222 @@
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Callable, List, Optional, Tuple
+
+from botocore.exceptions import ClientError
+
+# Provisionamento idempotente do agente Bedrock: reaproveita agente, action groups e
+# alias existentes (pelo nome ou pelo cache local), atualiza apenas o que mudou, cria
+# os action groups em paralelo e aguarda a preparação antes de criar/atualizar o alias.
+#
+# O cache local guarda os ids por impressão digital da definição (instruções, modelo,
+# schemas); com o cache quente, basta uma chamada get_agent_alias para confirmar.
+
+AGENT_CACHE_FILE = os.environ.get('BEDROCK_AGENT_CACHE_FILE', '.agent_cache.json')
+PREPARE_TIMEOUT = float(os.environ.get('BEDROCK_PREPARE_TIMEOUT', '300'))
+POLL_INITIAL_DELAY = float(os.environ.get('BEDROCK_POLL_INITIAL_DELAY', '0.5'))
+POLL_MAX_DELAY = float(os.environ.get('BEDROCK_POLL_MAX_DELAY', '5'))
+
+AGENT_FIELDS = (
+    'agentName',
+    'agentResourceRoleArn',
+    'description',
+    'foundationModel',
+    'instruction',
+    'idleSessionTTLInSeconds'
+)
+ACTION_GROUP_FIELDS = ('description', 'actionGroupExecutor', 'functionSchema')
+
+
+def fingerprint(definition: Dict[str, Any]) -> str:
+    """Hash estável da definição completa do agente"""
+    return hashlib.sha256(json.dumps(definition, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _load_cache(path: str) -> Dict[str, Any]:
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_cache(path: str, cache: Dict[str, Any]) -> None:
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def wait_for_status(get_status: Callable[[], str], ready: Tuple[str, ...], description: str,
+                    timeout: float = PREPARE_TIMEOUT) -> str:
+    """Consulta o status com backoff exponencial até um dos estados de `ready`"""
+    delay = POLL_INITIAL_DELAY
+    deadline = time.monotonic() + timeout
+    while True:
+        status = get_status()
+        if status in ready:
+            return status
+        if status == 'FAILED':
+            raise RuntimeError(f'{description} falhou (status FAILED)')
+        if time.monotonic() + delay > deadline:
+            raise TimeoutError(f'{description} não concluiu em {timeout:.0f}s (status {status})')
+        time.sleep(delay)
+        delay = min(delay * 2, POLL_MAX_DELAY)
+
+
+def _paginate(client, operation: str, key: str, **params) -> List[Dict[str, Any]]:
+    items = []
+    for page in client.get_paginator(operation).paginate(**params):
+        items.extend(page[key])
+    return items
+
+
+class AgentProvisioner:
+    """
+    Garante que o agente descrito em `definition` exista e esteja preparado.
+    definition: {'agent': {...create_agent...}, 'action_groups': [{...}], 'alias_name': str}
+    """
+
+    def __init__(self, client, definition: Dict[str, Any], cache_file: Optional[str] = AGENT_CACHE_FILE):
+        self.client = client
+        self.definition = definition
+        self.cache_file = cache_file
+        self.fingerprint = fingerprint(definition)
+        self.changed = False
+
+    def provision(self) -> Tuple[str, str]:
+        """Retorna (agent_id, agent_alias_id), criando ou atualizando apenas o necessário"""
+        cached = self._from_cache()
+        if cached:
+            return cached
+
+        agent_id = self._ensure_agent()
+        self._ensure_action_groups(agent_id)
+
+        status = self.client.get_agent(agentId=agent_id)['agent']['agentStatus']
+        if self.changed or status != 'PREPARED':
+            self.client.prepare_agent(agentId=agent_id)
+            wait_for_status(
+                lambda: self.client.get_agent(agentId=agent_id)['agent']['agentStatus'],
+                ('PREPARED',), 'Preparação do agente'
+            )
+
+        alias_id = self._ensure_alias(agent_id)
+
+        if self.cache_file:
+            cache = _load_cache(self.cache_file)
+            cache[self.fingerprint] = {'agent_id': agent_id, 'agent_alias_id': alias_id}
+            _save_cache(self.cache_file, cache)
+        return agent_id, alias_id
+
+    def _from_cache(self) -> Optional[Tuple[str, str]]:
+        if not self.cache_file:
+            return None
+        entry = _load_cache(self.cache_file).get(self.fingerprint)
+        if not entry:
+            return None
+        try:
+            alias = self.client.get_agent_alias(
+                agentId=entry['agent_id'], agentAliasId=entry['agent_alias_id']
+            )['agentAlias']
+        except ClientError:
+            return None
+        if alias['agentAliasStatus'] != 'PREPARED':
+            return None
+        return entry['agent_id'], entry['agent_alias_id']
+
+    def _ensure_agent(self) -> str:
+        desired = self.definition['agent']
+        existing = next(
+            (a for a in _paginate(self.client, 'list_agents', 'agentSummaries')
+             if a['agentName'] == desired['agentName']),
+            None
+        )
+
+        if existing is None:
+            agent_id = self.client.create_agent(**desired)['agent']['agentId']
+            self.changed = True
+            print(f"Agente criado com ID: {agent_id}")
+        else:
+            agent_id = existing['agentId']
+            current = self.client.get_agent(agentId=agent_id)['agent']
+            if any(current.get(field) != desired.get(field) for field in AGENT_FIELDS):
+                wait_for_status(
+                    lambda: self.client.get_agent(agentId=agent_id)['agent']['agentStatus'],
+                    ('NOT_PREPARED', 'PREPARED', 'FAILED'), 'Agente'
+                )
+                self.client.update_agent(agentId=agent_id, **desired)
+                self.changed = True
+                print(f"Agente atualizado: {agent_id}")
+            else:
+                print(f"Agente existente reutilizado: {agent_id}")
+
+        # create_agent/update_agent são assíncronos: aguardar antes dos action groups
+        wait_for_status(
+            lambda: self.client.get_agent(agentId=agent_id)['agent']['agentStatus'],
+            ('NOT_PREPARED', 'PREPARED'), 'Criação do agente'
+        )
+        return agent_id
+
+    def _ensure_action_groups(self, agent_id: str) -> None:
+        existing = {
+            group['actionGroupName']: group['actionGroupId']
+            for group in _paginate(self.client, 'list_agent_action_groups', 'actionGroupSummaries',
+                                   agentId=agent_id, agentVersion='DRAFT')
+        }
+
+        def ensure(group: Dict[str, Any]) -> bool:
+            group_id = existing.get(group['actionGroupName'])
+            if group_id is None:
+                self.client.create_agent_action_group(agentId=agent_id, agentVersion='DRAFT', **group)
+                return True
+
+            current = self.client.get_agent_action_group(
+                agentId=agent_id, agentVersion='DRAFT', actionGroupId=group_id
+            )['agentActionGroup']
+            if all(current.get(field) == group.get(field) for field in ACTION_GROUP_FIELDS):
+                return False
+            self.client.update_agent_action_group(
+                agentId=agent_id, agentVersion='DRAFT', actionGroupId=group_id, **group
+            )
+            return True
+
+        groups = self.definition['action_groups']
+        with ThreadPoolExecutor(max_workers=max(1, len(groups))) as executor:
+            if any(list(executor.map(ensure, groups))):
+                self.changed = True
+
+    def _ensure_alias(self, agent_id: str) -> str:
+        alias_name = self.definition['alias_name']
+        existing = next(
+            (a for a in _paginate(self.client, 'list_agent_aliases', 'agentAliasSummaries', agentId=agent_id)
+             if a['agentAliasName'] == alias_name),
+            None
+        )
+
+        if existing is None:
+            alias_id = self.client.create_agent_alias(
+                agentId=agent_id, agentAliasName=alias_name
+            )['agentAlias']['agentAliasId']
+            print(f"Alias criado: {alias_id}")
+        else:
+            alias_id = existing['agentAliasId']
+            if self.changed:
+                # Nova versão do agente a partir do DRAFT preparado
+                self.client.update_agent_alias(agentId=agent_id, agentAliasId=alias_id, agentAliasName=alias_name)
+                print(f"Alias atualizado: {alias_id}")
+
+        wait_for_status(
+            lambda: self.client.get_agent_alias(agentId=agent_id, agentAliasId=alias_id)['agentAlias']['agentAliasStatus'],
+            ('PREPARED',), 'Alias do agente'
+        )
+        return alias_id
+
+
+def provision_agent(client, definition: Dict[str, Any],
+                    cache_file: Optional[str] = AGENT_CACHE_FILE) -> Tuple[str, str]:
+    """Atalho para AgentProvisioner(client, definition, cache_file).provision()"""
+    return AgentProvisioner(client, definition, cache_file).provision()
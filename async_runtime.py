@@ -0,0 +1,85 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+from main import DocumentValidationAgent, ValidationSession
+
+# Runtime asyncio para muitas sessões de validação simultâneas em um único worker.
+# O boto3 é síncrono: cada turno roda em um pool de threads dedicado, sem bloquear
+# o event loop. Aumente AWS_MAX_POOL_CONNECTIONS junto com AGENT_MAX_CONCURRENCY.
+
+MAX_CONCURRENCY = int(os.environ.get('AGENT_MAX_CONCURRENCY', '64'))
+MAX_PENDING = int(os.environ.get('AGENT_MAX_PENDING', '512'))
+SESSION_IDLE_TTL = float(os.environ.get('AGENT_SESSION_IDLE_TTL', '3600'))
+# Intervalo mínimo entre varreduras de sessões ociosas (feitas ao criar sessões)
+SESSION_SWEEP_INTERVAL = float(os.environ.get('AGENT_SESSION_SWEEP_INTERVAL', '60'))
+
+
+class RuntimeBusyError(Exception):
+    """Fila de turnos cheia: o chamador deve tentar novamente mais tarde"""
+
+
+class AsyncAgentRuntime:
+    def __init__(self, agent: DocumentValidationAgent, max_concurrency: int = MAX_CONCURRENCY,
+                 max_pending: int = MAX_PENDING):
+        self.agent = agent
+        self.max_pending = max_pending
+        self.sessions: Dict[str, ValidationSession] = {}
+        self.pending = 0
+        self._last_sweep = time.time()
+
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._session_locks: Dict[str, asyncio.Lock] = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='session')
+
+    def create_session(self, session_id: Optional[str] = None) -> str:
+        # Sessões abandonadas (sem close_session) expiram aqui, no máximo uma varredura por intervalo
+        if time.time() - self._last_sweep >= SESSION_SWEEP_INTERVAL:
+            self.expire_idle_sessions()
+        session = ValidationSession(session_id)
+        self.sessions[session.session_id] = session
+        self._session_locks[session.session_id] = asyncio.Lock()
+        return session.session_id
+
+    def close_session(self, session_id: str) -> None:
+        self.sessions.pop(session_id, None)
+        self._session_locks.pop(session_id, None)
+
+    def expire_idle_sessions(self, ttl: float = SESSION_IDLE_TTL) -> int:
+        """Remove sessões sem uso há mais de ttl segundos"""
+        self._last_sweep = time.time()
+        limit = self._last_sweep - ttl
+        expired = [
+            session_id for session_id, session in self.sessions.items()
+            if session.last_used < limit and not self._session_locks[session_id].locked()
+        ]
+        for session_id in expired:
+            self.close_session(session_id)
+        return len(expired)
+
+    async def chat(self, session_id: str, user_input: str) -> str:
+        """
+        Executa um turno da sessão. Turnos de uma mesma sessão são serializados;
+        o total de turnos em execução é limitado e, com a fila cheia, o turno é recusado.
+        """
+        session = self.sessions.get(session_id)
+        if session is None:
+            raise KeyError(f'Sessão não encontrada: {session_id}')
+
+        if self.pending >= self.max_pending:
+            raise RuntimeBusyError(f'{self.pending} turnos pendentes; tente novamente')
+
+        self.pending += 1
+        try:
+            async with self._session_locks[session_id], self._semaphore:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self._executor, self.agent.chat, user_input, session)
+        finally:
+            self.pending -= 1
+
+    async def shutdown(self) -> None:
+        """Aguarda os turnos em andamento e libera as threads"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._executor.shutdown, True)
@@ -0,0 +1,77 @@
+import os
+import threading
+from typing import Dict, Any, Optional
+
+import boto3
+from botocore.config import Config
+
+# Registro de clientes AWS compartilhado pelo processo (container Lambda / agente).
+# Cada cliente é criado uma única vez e reutilizado entre invocações, mantendo
+# o pool de conexões HTTP (e o handshake TLS) aquecido.
+
+_clients: Dict[str, Any] = {}
+_lock = threading.Lock()
+_config: Optional[Config] = None
+
+
+def _default_config() -> Config:
+    """
+    Configuração padrão do botocore, ajustável por variáveis de ambiente.
+    Retentativas em modo adaptive: backoff exponencial com jitter e limitação
+    de taxa no cliente quando o serviço responde com throttling.
+    """
+    return Config(
+        max_pool_connections=int(os.environ.get('AWS_MAX_POOL_CONNECTIONS', '32')),
+        tcp_keepalive=os.environ.get('AWS_TCP_KEEPALIVE', '1') == '1',
+        connect_timeout=float(os.environ.get('AWS_CONNECT_TIMEOUT', '5')),
+        read_timeout=float(os.environ.get('AWS_READ_TIMEOUT', '60')),
+        retries={
+            'mode': os.environ.get('AWS_RETRY_MODE', 'adaptive'),
+            'max_attempts': int(os.environ.get('AWS_MAX_ATTEMPTS', '4'))
+        },
+    )
+
+
+def configure(config: Config) -> None:
+    """
+    Define a configuração usada para novos clientes e descarta os já criados
+    """
+    global _config
+    with _lock:
+        _config = config
+        _clients.clear()
+
+
+def get_client(service: str) -> Any:
+    """
+    Retorna o cliente do serviço, criando-o na primeira chamada (thread-safe)
+    """
+    client = _clients.get(service)
+    if client is not None:
+        return client
+
+    with _lock:
+        client = _clients.get(service)
+        if client is None:
+            global _config
+            if _config is None:
+                _config = _default_config()
+            client = boto3.client(service, config=_config)
+            _clients[service] = client
+        return client
+
+
+def set_client(service: str, client: Any) -> None:
+    """
+    Substitui o cliente de um serviço (ex.: cliente com Stubber em testes)
+    """
+    with _lock:
+        _clients[service] = client
+
+
+def reset_clients() -> None:
+    """
+    Remove todos os clientes registrados
+    """
+    with _lock:
+        _clients.clear()
@@ -0,0 +1,183 @@
+import argparse
+import base64
+import json
+import mimetypes
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, Any, Iterator, List, Optional, Set, Tuple
+
+import metrics
+from ferramenta1 import store_image
+from ferramenta2 import lambda_handler as textract_handler
+from ferramenta3 import lambda_handler as rekognition_handler
+from tool_registry import make_event
+
+# Revalidação em lote a partir de um manifesto JSONL, sem passar pelo agente.
+#
+# Cada linha do manifesto: {"id": "...", "document": <ref>, "selfie": <ref>}
+# onde <ref> é s3://bucket/key, um caminho local ou uma data URL base64.
+#
+#   python batch_validation.py manifesto.jsonl resultados.jsonl --workers 8
+#
+# Os resultados são gravados linha a linha; ao reexecutar com o mesmo arquivo de
+# saída, os ids já presentes são pulados.
+
+STAGES = ('upload', 'extract', 'compare')
+
+
+def _parse_ref(ref: str) -> Tuple[str, str]:
+    """Converte uma referência em (bucket, key), fazendo upload quando não for s3://"""
+    if ref.startswith('s3://'):
+        bucket, _, key = ref[5:].partition('/')
+        return bucket, key
+
+    if ref.startswith('data:'):
+        header, _, payload = ref.partition(',')
+        content_type = header[5:].split(';')[0] or 'image/jpeg'
+        stored = store_image(base64.b64decode(payload), content_type)
+    else:
+        content_type = mimetypes.guess_type(ref)[0] or 'image/jpeg'
+        with open(ref, 'rb') as f:
+            stored = store_image(f.read(), content_type)
+    return stored['bucket'], stored['key']
+
+
+def validate_record(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Executa upload -> extract_text_from_document -> compare_faces para um par"""
+    timings = {}
+    result = {'id': record['id']}
+
+    start = time.perf_counter()
+    try:
+        doc_bucket, doc_key = _parse_ref(record['document'])
+        selfie_bucket, selfie_key = _parse_ref(record['selfie'])
+    except Exception as e:
+        result['error'] = f'Erro ao fazer upload: {str(e)}'
+        return result
+    timings['upload'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    extraction = textract_handler(
+        make_event('extract_text_from_document', bucket=doc_bucket, key=doc_key), None
+    )['response']
+    timings['extract'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    comparison = rekognition_handler(
+        make_event('compare_faces', source_bucket=doc_bucket, source_key=doc_key,
+               target_bucket=selfie_bucket, target_key=selfie_key), None
+    )['response']
+    timings['compare'] = time.perf_counter() - start
+
+    result.update({
+        'document': f's3://{doc_bucket}/{doc_key}',
+        'selfie': f's3://{selfie_bucket}/{selfie_key}',
+        'extracted_data': extraction.get('extracted_data'),
+        'validated': comparison.get('validated', False),
+        'similarity': comparison.get('similarity'),
+        'errors': [r['error'] for r in (extraction, comparison) if 'error' in r],
+        'timings_ms': {stage: round(t * 1000, 2) for stage, t in timings.items()}
+    })
+    return result
+
+
+def _done_ids(output_path: str) -> Set[str]:
+    """Ids já presentes no arquivo de saída (para retomar)"""
+    done = set()
+    if os.path.exists(output_path):
+        with open(output_path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    done.add(json.loads(line)['id'])
+                except (ValueError, KeyError):
+                    # Linha parcial de uma execução interrompida
+                    continue
+    return done
+
+
+def _read_manifest(manifest_path: str, done: Set[str]) -> Iterator[Dict[str, Any]]:
+    with open(manifest_path, encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            record.setdefault('id', str(number))
+            if record['id'] not in done:
+                yield record
+
+
+def run_batch(manifest_path: str, output_path: str, workers: int = 8,
+              max_in_flight: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Processa o manifesto com um pool limitado de threads, gravando cada resultado
+    assim que termina. Retorna o resumo de vazão e latência por etapa.
+    """
+    max_in_flight = max_in_flight or workers * 2
+    done = _done_ids(output_path)
+    stage_samples: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+    processed = 0
+    failed = 0
+    start = time.perf_counter()
+
+    with open(output_path, 'a', encoding='utf-8') as output, ThreadPoolExecutor(max_workers=workers) as executor:
+        # Isolar uma possível linha parcial deixada por uma execução interrompida
+        if output.tell() > 0:
+            with open(output_path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    output.write('\n')
+
+        in_flight = set()
+        records = _read_manifest(manifest_path, done)
+
+        def collect(futures) -> None:
+            nonlocal processed, failed
+            for future in futures:
+                result = future.result()
+                output.write(json.dumps(result, ensure_ascii=False) + '\n')
+                output.flush()
+                processed += 1
+                if result.get('error') or result.get('errors'):
+                    failed += 1
+                for stage, ms in result.get('timings_ms', {}).items():
+                    stage_samples[stage].append(ms)
+
+        for record in records:
+            # Janela limitada: não carrega o manifesto inteiro em memória
+            if len(in_flight) >= max_in_flight:
+                finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(finished)
+            in_flight.add(executor.submit(validate_record, record))
+
+        collect(wait(in_flight).done)
+
+    elapsed = time.perf_counter() - start
+    return {
+        'processed': processed,
+        'skipped': len(done),
+        'failed': failed,
+        'elapsed_s': round(elapsed, 2),
+        'throughput_per_s': round(processed / elapsed, 2) if elapsed else 0.0,
+        'stages_ms': {
+            stage: metrics.percentiles(samples)
+            for stage, samples in stage_samples.items() if samples
+        }
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='Validação em lote de pares documento/selfie')
+    parser.add_argument('manifest', help='Manifesto JSONL com id, document e selfie')
+    parser.add_argument('output', help='Arquivo JSONL de resultados (retomado se já existir)')
+    parser.add_argument('--workers', type=int, default=8, help='Tamanho do pool de threads')
+    args = parser.parse_args(argv)
+
+    summary = run_batch(args.manifest, args.output, args.workers)
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,490 @@
+import base64
+import io
+import multiprocessing
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, Callable, List
+
+# Credenciais e região fictícias: nenhuma chamada sai do processo
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'benchmark')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'benchmark')
+# Cache do Textract desligado por padrão para medir o caminho completo
+os.environ.setdefault('TEXTRACT_CACHE_ENABLED', '0')
+# Payloads sintéticos não são imagens válidas: sem normalização, recorte de face nem controle de qualidade
+os.environ.setdefault('IMAGE_NORMALIZE', '0')
+os.environ.setdefault('FACE_CROP_ENABLED', '0')
+os.environ.setdefault('IMAGE_QUALITY_GATE', '0')
+
+from botocore.stub import Stubber
+
+import aws_clients
+import ferramenta1
+import ferramenta2
+import image_preprocessing
+import local_aws
+import metrics
+import resilience
+import textract_cache
+from ferramenta1 import lambda_handler as upload_handler
+from ferramenta2 import lambda_handler as textract_handler
+from ferramenta3 import lambda_handler as rekognition_handler
+from tool_registry import make_event
+
+ITERATIONS = int(os.environ.get('BENCH_ITERATIONS', '50'))
+
+_stubbers: Dict[str, Stubber] = {}
+
+
+def _stub(service: str, method: str, response: Dict[str, Any]) -> None:
+    """Garante um Stubber ativo no cliente atual do registro e enfileira a resposta"""
+    client = aws_clients.get_client(service)
+    stubber = _stubbers.get(service)
+    if stubber is None or stubber.client is not client:
+        stubber = Stubber(client)
+        stubber.activate()
+        _stubbers[service] = stubber
+    stubber.add_response(method, response)
+
+
+SCENARIOS = {
+    'upload_to_s3': (
+        upload_handler,
+        make_event('upload_to_s3', image_data='data:image/jpeg;base64,' + base64.b64encode(b'\xff' * 4096).decode()),
+        [('s3', 'put_object', {})]
+    ),
+    'extract_text_from_document': (
+        textract_handler,
+        make_event('extract_text_from_document', bucket='document-validation-poc', key='images/doc.jpg'),
+        [('textract', 'analyze_document', local_aws.textract_blocks(40))]
+    ),
+    'compare_faces': (
+        rekognition_handler,
+        make_event('compare_faces', source_bucket='document-validation-poc', source_key='doc.jpg',
+               target_bucket='document-validation-poc', target_key='selfie.jpg'),
+        [('rekognition', 'compare_faces', {'FaceMatches': [{'Similarity': 97.5}]})]
+    ),
+    'get_face_details': (
+        rekognition_handler,
+        make_event('get_face_details', bucket='document-validation-poc', key='doc.jpg'),
+        [('rekognition', 'detect_faces', {'FaceDetails': []})]
+    ),
+}
+
+
+def _measure(handler: Callable, event: Dict[str, Any], stubs: List, cold: bool) -> List[float]:
+    samples = []
+    for _ in range(ITERATIONS):
+        if cold:
+            aws_clients.reset_clients()
+        start = time.perf_counter()
+        for service, method, response in stubs:
+            _stub(service, method, response)
+        result = handler(event, None)
+        samples.append((time.perf_counter() - start) * 1000)
+        if 'error' in result['response']:
+            raise RuntimeError(result['response']['error'])
+    return samples
+
+
+def bench_client_registry() -> None:
+    """Overhead por invocação com cliente frio (criado a cada chamada) vs quente (registro)"""
+    print(f"\n== Registro de clientes ({ITERATIONS} iterações, ms) ==")
+    print(f"{'ferramenta':<30}{'frio p50':>10}{'quente p50':>12}{'ganho':>8}")
+    for name, (handler, event, stubs) in SCENARIOS.items():
+        cold = statistics.median(_measure(handler, event, stubs, cold=True))
+        warm = statistics.median(_measure(handler, event, stubs, cold=False))
+        print(f"{name:<30}{cold:>10.3f}{warm:>12.3f}{cold / warm:>7.1f}x")
+
+
+def _reset_peak_rss() -> bool:
+    """Zera o pico de RSS do processo (VmHWM); False fora do Linux"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _rss_bytes(field: str) -> int:
+    """VmRSS (atual) ou VmHWM (pico) de /proc/self/status, em bytes"""
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def _upload_memory_case(magic: bytes, content_type: str, default_config: bool,
+                        size: int, wrapped: bool) -> tuple:
+    """
+    Um caso de bench_upload_memory, executado em um processo novo (spawn) para que o
+    RSS não reaproveite memória liberada pelos casos anteriores.
+    Retorna (modo, pico de RSS acima do início da chamada ou None, pico do tracemalloc).
+    """
+    ferramenta1.NORMALIZE_IMAGES = ferramenta1.QUALITY_GATE_ENABLED = default_config
+    chunk = ferramenta1.MULTIPART_CHUNKSIZE
+    raw = magic + os.urandom(size - len(magic))
+    encoded = base64.encodebytes(raw) if wrapped else base64.b64encode(raw)
+    image_data = f'data:{content_type};base64,' + encoded.decode()
+    del raw, encoded
+    event = make_event('upload_to_s3', image_data=image_data)
+    
+    if size < ferramenta1.MULTIPART_THRESHOLD:
+        mode = 'put'
+        _stub('s3', 'put_object', {})
+    else:
+        mode = 'multipart'
+        _stub('s3', 'create_multipart_upload', {'UploadId': 'bench'})
+        for _ in range(-(-size // chunk)):
+            _stub('s3', 'upload_part', {'ETag': '"bench"'})
+        _stub('s3', 'complete_multipart_upload', {})
+    
+    rss = _reset_peak_rss()
+    rss_before = _rss_bytes('VmRSS') if rss else 0
+    tracemalloc.start()
+    result = upload_handler(event, None)
+    traced_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    rss_peak = _rss_bytes('VmHWM') - rss_before if rss else None
+    if 'error' in result['response']:
+        raise RuntimeError(result['response']['error'])
+    return mode, rss_peak, traced_peak
+
+
+def bench_upload_memory() -> None:
+    """
+    Pico de memória em upload_to_s3 conforme o arquivo cresce, com base64 contínuo e
+    quebrado em linhas (MIME): RSS do processo acima do início da chamada (Linux) e
+    pico do tracemalloc. PDFs rodam na configuração padrão (normalização e controle de
+    qualidade ligados); os JPEGs sintéticos não decodificam e passam pelo caminho sem
+    normalização. No multipart, falha se o tracemalloc passar de max_concurrency ×
+    chunksize mais o buffer de leitura, ou o RSS desse limite mais 4 chunks; o caso de
+    128 MB mostra que o pico não acompanha o tamanho do arquivo.
+    """
+    print("\n== Memória do upload_to_s3 (pico acima do início da chamada, MB) ==")
+    print(f"{'arquivo':>8}{'MB':>5}{'modo':>12}{'base64':>10}{'RSS':>8}{'limite':>8}{'tracemalloc':>13}{'limite':>8}")
+    chunk = ferramenta1.MULTIPART_CHUNKSIZE
+    # Partes em envio + parte lida à frente pelo s3transfer + buffer do BufferedReader
+    # + bloco decodificado pendente
+    limit = (ferramenta1.TRANSFER_CONFIG.max_concurrency + 3) * chunk + 4 * 1024 * 1024
+    # No RSS, folga para fragmentação do alocador e pilhas das threads do multipart
+    rss_limit = limit + 4 * chunk
+    cases = [('pdf', b'%PDF-1.7\n', 'application/pdf', True),
+             ('jpeg', b'\xff\xd8\xff', 'image/jpeg', False)]
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'),
+                             max_tasks_per_child=1) as pool:
+        for label, magic, content_type, default_config in cases:
+            for size_mb in (1, 4, 16, 64, 128):
+                for wrapped in (False, True):
+                    mode, rss_peak, traced_peak = pool.submit(
+                        _upload_memory_case, magic, content_type, default_config, size_mb * 1024 * 1024, wrapped
+                    ).result()
+                    shown_rss = f'{rss_peak / 1024 / 1024:.1f}' if rss_peak is not None else '-'
+                    multipart = mode == 'multipart'
+                    print(f"{label:>8}{size_mb:>5}{mode:>12}{'linhas' if wrapped else 'contínuo':>10}"
+                          f"{shown_rss:>8}{rss_limit / 1024 / 1024 if multipart else '-':>8}"
+                          f"{traced_peak / 1024 / 1024:>13.1f}{limit / 1024 / 1024 if multipart else '-':>8}")
+                    for kind, peak, bound in (('RSS', rss_peak, rss_limit), ('tracemalloc', traced_peak, limit)):
+                        if multipart and peak is not None and peak > bound:
+                            raise RuntimeError(
+                                f'Pico de memória ({kind}) do upload multipart ({peak / 1024 / 1024:.1f} MB) acima '
+                                f'do limite ({bound / 1024 / 1024:.1f} MB) para {label} de {size_mb} MB'
+                            )
+
+
+def bench_textract_cache() -> None:
+    """
+    Latência de extract_text_from_document com miss vs hit no cache em memória, para
+    chaves endereçadas por conteúdo e para as chaves padrão (timestamp+uuid) gravadas
+    por store_image. Nenhum caso pode chamar head_object (não há resposta enfileirada).
+    """
+    print(f"\n== Cache do Textract ({ITERATIONS} iterações, ms) ==")
+    os.environ['TEXTRACT_CACHE_ENABLED'] = '1'
+    cache = textract_cache.get_textract_cache()
+    response = local_aws.textract_blocks(2000)
+    
+    def content_key(i: int) -> str:
+        return f'images/sha256/{i:064x}.jpg'
+    
+    def stored_key(i: int) -> str:
+        # Versão registrada no PUT (ETag), sem head_object na extração
+        _stub('s3', 'put_object', {'ETag': f'"{i:032x}"'})
+        return ferramenta1.store_image(b'\xff\xd8\xff' + os.urandom(1024), deduplicate=False)['key']
+    
+    for label, make_key in (('sha256/', content_key), ('padrão', stored_key)):
+        misses, hits = [], []
+        for i in range(ITERATIONS):
+            event = make_event('extract_text_from_document', bucket='document-validation-poc', key=make_key(i))
+            _stub('textract', 'analyze_document', response)
+            for samples in (misses, hits):
+                start = time.perf_counter()
+                result = textract_handler(event, None)
+                samples.append((time.perf_counter() - start) * 1000)
+                if 'error' in result['response']:
+                    raise RuntimeError(result['response']['error'])
+        print(f"{label:<8} miss p50 {statistics.median(misses):.3f}  hit p50 {statistics.median(hits):.3f}  "
+              f"(último={result['response']['cache']})")
+    os.environ['TEXTRACT_CACHE_ENABLED'] = '0'
+    print(f"total: hits={cache.hits}, misses={cache.misses}")
+
+
+def bench_textract_blocks() -> None:
+    """Concatenação de LINEs + regex (versão anterior) vs índice de blocos FORMS"""
+    print(f"\n== Processamento de blocos do Textract ({ITERATIONS} iterações, ms) ==")
+    print(f"{'blocos':>8}{'anterior p50':>14}{'índice p50':>12}")
+    for lines in (100, 1000, 5000):
+        blocks = local_aws.textract_blocks(lines, key_every=25)['Blocks']
+        legacy, indexed = [], []
+        for _ in range(ITERATIONS):
+            start = time.perf_counter()
+            text = ""
+            for block in blocks:
+                if block['BlockType'] == 'LINE':
+                    text += block['Text'] + " "
+            anterior = ferramenta2.extract_document_data(text)
+            legacy.append((time.perf_counter() - start) * 1000)
+            
+            start = time.perf_counter()
+            _, dados = ferramenta2.extract_from_blocks(blocks)
+            indexed.append((time.perf_counter() - start) * 1000)
+        assert dados['nome'] == 'MARIA DA SILVA SANTOS', dados
+        print(f"{len(blocks):>8}{statistics.median(legacy):>14.3f}{statistics.median(indexed):>12.3f}"
+              f"   nome anterior={anterior['nome']!r}")
+
+
+def bench_extract_many() -> None:
+    """Vazão de DocumentDataExtractor.extract_many sobre raw_text armazenado"""
+    print("\n== Reprocessamento em lote de raw_text (registros/s) ==")
+    texts = [
+        f'REPUBLICA FEDERATIVA DO BRASIL registro {i} NOME MARIA DA SILVA '
+        f'CPF {i % 1000:03d}.444.777-35 NASCIMENTO 01/02/1990 emissao 03/04/2015'
+        for i in range(50000)
+    ]
+    extractor = ferramenta2.DocumentDataExtractor()
+    for processes in (None, os.cpu_count()):
+        start = time.perf_counter()
+        count = sum(1 for _ in extractor.extract_many(texts, processes=processes))
+        elapsed = time.perf_counter() - start
+        print(f"processos={processes or 1:<4} {count / elapsed:>12,.0f}")
+
+
+def bench_image_normalization() -> None:
+    """Tamanho e tempo da normalização (EXIF, redução, recompressão) de fotos de celular"""
+    from PIL import Image
+    
+    print("\n== Normalização de imagens ==")
+    print(f"{'resolução':>12}{'original KB':>13}{'gravado KB':>12}{'ms':>8}")
+    for width, height in ((1024, 768), (3024, 4032), (4000, 3000)):
+        pixels = os.urandom(width * height // 64)
+        image = Image.frombytes('L', (width // 8, height // 8), pixels).resize((width, height)).convert('RGB')
+        exif = Image.Exif()
+        exif[image_preprocessing.EXIF_ORIENTATION] = 6
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG', quality=95, exif=exif)
+        data = buffer.getvalue()
+        
+        start = time.perf_counter()
+        _, _, info = image_preprocessing.normalize_image(data)
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"{f'{width}x{height}':>12}{info['original_bytes'] / 1024:>13.0f}"
+              f"{info['stored_bytes'] / 1024:>12.0f}{elapsed:>8.1f}  -> {info.get('width')}x{info.get('height')}")
+
+
+def bench_quality_gate() -> None:
+    """Tempo do controle de qualidade local por tipo de imagem (nítida, desfocada, escura, pequena)"""
+    from PIL import Image, ImageEnhance, ImageFilter
+    
+    width, height = 3024, 4032
+    pixels = os.urandom(width * height // 64)
+    sharp = Image.frombytes('L', (width // 8, height // 8), pixels).resize((width, height)).convert('RGB')
+    cases = {
+        'nítida': sharp,
+        'desfocada': sharp.filter(ImageFilter.GaussianBlur(24)),
+        'escura': ImageEnhance.Brightness(sharp).enhance(0.1),
+        'pequena': sharp.resize((240, 320))
+    }
+    
+    print(f"\n== Controle de qualidade ({width}x{height}, {ITERATIONS} iterações, ms) ==")
+    print(f"{'imagem':<12}{'p50':>8}{'p95':>8}  resultado")
+    for name, image in cases.items():
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG', quality=90)
+        data = buffer.getvalue()
+        samples = []
+        for _ in range(ITERATIONS):
+            start = time.perf_counter()
+            try:
+                image_preprocessing.check_image_quality(data)
+                result = 'aprovada'
+            except image_preprocessing.ImageQualityError as e:
+                result = f'rejeitada ({e.reason})'
+            samples.append((time.perf_counter() - start) * 1000)
+        p = metrics.percentiles(samples)
+        print(f"{name:<12}{p['p50']:>8.1f}{p['p95']:>8.1f}  {result}")
+
+
+def bench_handlers() -> None:
+    """
+    Os lambda_handler das três ferramentas contra clientes locais, com latência
+    (BENCH_LATENCY_MS) e taxa de erros (BENCH_ERROR_RATE) injetadas
+    """
+    latency_ms = float(os.environ.get('BENCH_LATENCY_MS', '0'))
+    error_rate = float(os.environ.get('BENCH_ERROR_RATE', '0'))
+    lines = int(os.environ.get('BENCH_TEXTRACT_LINES', '2000'))
+    fakes = local_aws.install_fake_clients(latency_ms, error_rate, textract_lines=lines, seed=42)
+    
+    bucket = 'document-validation-poc'
+    fakes['s3'].objects[f'{bucket}/images/doc.jpg'] = b'\xff\xd8\xff'
+    scenarios = {
+        'upload_to_s3': (upload_handler, SCENARIOS['upload_to_s3'][1]),
+        'extract_text_from_document': (textract_handler, make_event(
+            'extract_text_from_document', bucket=bucket, key='images/doc.jpg')),
+        'compare_faces': (rekognition_handler, make_event(
+            'compare_faces', source_bucket=bucket, source_key='images/doc.jpg',
+            target_bucket=bucket, target_key='images/selfie.jpg')),
+        'get_face_details': (rekognition_handler, make_event(
+            'get_face_details', bucket=bucket, key='images/doc.jpg')),
+    }
+    
+    print(f"\n== Handlers com clientes locais ({ITERATIONS} iterações, latência {latency_ms} ms, "
+          f"erros {error_rate:.0%}, {lines} linhas Textract) ==")
+    print(f"{'ferramenta':<30}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'erros':>7}{'pico KB/chamada':>17}")
+    try:
+        for name, (handler, event) in scenarios.items():
+            samples = []
+            errors = 0
+            for _ in range(ITERATIONS):
+                start = time.perf_counter()
+                result = handler(event, None)
+                samples.append((time.perf_counter() - start) * 1000)
+                errors += 'error' in result['response']
+            
+            # Alocações medidas em uma passada separada (tracemalloc distorce o tempo)
+            peaks = []
+            tracemalloc.start()
+            for _ in range(min(ITERATIONS, 10)):
+                tracemalloc.reset_peak()
+                base = tracemalloc.get_traced_memory()[0]
+                handler(event, None)
+                peaks.append(tracemalloc.get_traced_memory()[1] - base)
+            tracemalloc.stop()
+            
+            p = metrics.percentiles(samples)
+            print(f"{name:<30}{p['p50']:>9.3f}{p['p95']:>9.3f}{p['p99']:>9.3f}{errors:>7}{statistics.median(peaks) / 1024:>17.1f}")
+    finally:
+        aws_clients.reset_clients()
+
+
+def bench_metrics() -> None:
+    """Overhead da instrumentação por chamada de ferramenta: desligada vs ligada"""
+    print(f"\n== Instrumentação (extract_text_from_document, {ITERATIONS} iterações, ms) ==")
+    print(f"{'métricas':<12}{'p50':>9}{'p95':>9}")
+    local_aws.install_fake_clients(textract_lines=60, seed=42)
+    event = make_event('extract_text_from_document', bucket='document-validation-poc', key='images/doc.jpg')
+    enabled = metrics.METRICS_ENABLED
+    try:
+        for label, flag in (('desligadas', False), ('ligadas', True)):
+            metrics.METRICS_ENABLED = flag
+            samples = []
+            for _ in range(ITERATIONS):
+                start = time.perf_counter()
+                textract_handler(event, None)
+                samples.append((time.perf_counter() - start) * 1000)
+            p = metrics.percentiles(samples)
+            print(f"{label:<12}{p['p50']:>9.3f}{p['p95']:>9.3f}")
+    finally:
+        metrics.METRICS_ENABLED = enabled
+        metrics.reset()
+        aws_clients.reset_clients()
+
+
+def bench_tail_latency() -> None:
+    """
+    p50/p99 de extract_text_from_document com outliers injetados (BENCH_SLOW_RATE das
+    chamadas demoram BENCH_SLOW_MS), sem e com a requisição de hedge
+    """
+    latency_ms = float(os.environ.get('BENCH_LATENCY_MS', '20'))
+    slow_rate = float(os.environ.get('BENCH_SLOW_RATE', '0.05'))
+    slow_ms = float(os.environ.get('BENCH_SLOW_MS', '500'))
+    iterations = max(ITERATIONS, 200)
+    print(f"\n== Latência de cauda ({iterations} iterações, {latency_ms} ms, "
+          f"{slow_rate:.0%} das chamadas com {slow_ms} ms) ==")
+    print(f"{'hedge':<8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'chamadas':>10}")
+    event = make_event('extract_text_from_document', bucket='document-validation-poc', key='images/doc.jpg')
+    hedge_enabled = resilience.HEDGE_ENABLED
+    try:
+        for label, flag in (('não', False), ('sim', True)):
+            resilience.reset()
+            resilience.HEDGE_ENABLED = flag
+            fakes = local_aws.install_fake_clients(latency_ms, textract_lines=60, seed=42,
+                                                   slow_rate=slow_rate, slow_ms=slow_ms)
+            samples = []
+            for _ in range(iterations):
+                start = time.perf_counter()
+                textract_handler(event, None)
+                samples.append((time.perf_counter() - start) * 1000)
+            p = metrics.percentiles(samples)
+            calls = sum(fakes['textract'].calls.values())
+            print(f"{label:<8}{p['p50']:>9.1f}{p['p95']:>9.1f}{p['p99']:>9.1f}{calls:>10}")
+    finally:
+        resilience.HEDGE_ENABLED = hedge_enabled
+        resilience.reset()
+        aws_clients.reset_clients()
+
+
+def bench_textract_async() -> None:
+    """
+    Modo assíncrono (PDF com várias páginas): tempo e pico de memória conforme o número
+    de páginas cresce, com os blocos processados página a página
+    """
+    poll_initial = ferramenta2.TEXTRACT_ASYNC_POLL_INITIAL
+    ferramenta2.TEXTRACT_ASYNC_POLL_INITIAL = 0.001
+    print("\n== Textract assíncrono (GetDocumentAnalysis paginado) ==")
+    print(f"{'páginas':>8}{'blocos':>9}{'ms':>9}{'pico MB':>9}{'chamadas':>10}")
+    bucket = 'document-validation-poc'
+    try:
+        for pages in (1, 10, 50):
+            fakes = local_aws.install_fake_clients(textract_lines=500, pages=pages, async_polls=2)
+            fakes['s3'].objects[f'{bucket}/docs/cnh.pdf'] = b'%PDF'
+            event = make_event('extract_text_from_document', bucket=bucket, key='docs/cnh.pdf')
+            
+            tracemalloc.start()
+            start = time.perf_counter()
+            response = textract_handler(event, None)['response']
+            elapsed = (time.perf_counter() - start) * 1000
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            
+            blocks = len(fakes['textract'].textract_response['Blocks']) * pages
+            calls = fakes['textract'].calls.get('GetDocumentAnalysis', 0)
+            print(f"{response.get('pages', 0):>8}{blocks:>9}{elapsed:>9.1f}{peak / 1024 / 1024:>9.1f}{calls:>10}")
+    finally:
+        ferramenta2.TEXTRACT_ASYNC_POLL_INITIAL = poll_initial
+        aws_clients.reset_clients()
+
+
+BENCHMARKS = {
+    'clients': bench_client_registry,
+    'upload_memory': bench_upload_memory,
+    'textract_cache': bench_textract_cache,
+    'textract_blocks': bench_textract_blocks,
+    'extract_many': bench_extract_many,
+    'image_normalization': bench_image_normalization,
+    'quality_gate': bench_quality_gate,
+    'handlers': bench_handlers,
+    'metrics': bench_metrics,
+    'tail_latency': bench_tail_latency,
+    'textract_async': bench_textract_async,
+}
+
+
+if __name__ == '__main__':
+    selected = sys.argv[1:] or list(BENCHMARKS)
+    for name in selected:
+        BENCHMARKS[name]()
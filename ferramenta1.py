@@ -1,70 +1,358 @@
-import boto3
 import base64
+import hashlib
+import io
 import json
-from typing import Dict, Any
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
 from datetime import datetime
 import uuid
 
-def upload_to_s3(event: Dict[str, Any]) -> Dict[str, Any]:
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
+
+import image_store
+import metrics
+import tool_registry
+from aws_clients import get_client
+from image_preprocessing import (
+    NORMALIZE_IMAGES, QUALITY_GATE_ENABLED, ImageQualityError, check_image_quality, detect_document_format,
+    normalize_image, render_first_page
+)
+from textract_cache import remember_version
+from tool_registry import Parameter, tool
+
+BUCKET_NAME = 'document-validation-poc'  # Configurar seu bucket
+
+EXTENSIONS = {
+    'image/jpeg': 'jpg',
+    'image/png': 'png',
+    'application/pdf': 'pdf',
+    'image/tiff': 'tiff'
+}
+
+# Acima deste tamanho (bytes decodificados) o upload é feito em streaming/multipart
+MULTIPART_THRESHOLD = int(os.environ.get('S3_MULTIPART_THRESHOLD', str(8 * 1024 * 1024)))
+MULTIPART_CHUNKSIZE = int(os.environ.get('S3_MULTIPART_CHUNKSIZE', str(8 * 1024 * 1024)))
+
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=MULTIPART_THRESHOLD,
+    multipart_chunksize=MULTIPART_CHUNKSIZE,
+    max_concurrency=int(os.environ.get('S3_MULTIPART_CONCURRENCY', '4'))
+)
+
+# Deduplicação: chave derivada do SHA-256 da imagem, com LRU das chaves já gravadas
+DEDUPLICATE_UPLOADS = os.environ.get('S3_DEDUPLICATE_UPLOADS', '0') == '1'
+SEEN_KEYS_MAX = int(os.environ.get('S3_SEEN_KEYS_MAX', '1024'))
+
+_seen_keys: 'OrderedDict[str, bool]' = OrderedDict()
+_seen_lock = threading.Lock()
+
+# Caracteres ignorados no base64 (quebras de linha do formato MIME)
+_WHITESPACE = str.maketrans('', '', ' \t\r\n')
+
+class Base64Reader(io.RawIOBase):
     """
-    Ferramenta 1: Upload de imagem em base64 para S3
+    Leitor que decodifica uma string base64 em blocos, sem materializar
+    a imagem inteira em memória. Aceita base64 quebrado em linhas (MIME, 76 colunas):
+    espaços são descartados e grupos incompletos de 4 caracteres passam para a próxima leitura.
+    """
+    def __init__(self, data: str, start: int = 0):
+        self._data = data
+        self._pos = start
+        self._pending = b''
+        self._partial = ''
+    
+    def readable(self) -> bool:
+        return True
+    
+    def readinto(self, buffer) -> int:
+        size = len(buffer)
+        chunk = self._pending
+        while len(chunk) < size and self._pos < len(self._data):
+            # Ler múltiplos de 4 caracteres para decodificar blocos completos
+            chars = ((size - len(chunk)) // 3 + 1) * 4
+            encoded = self._data[self._pos:self._pos + chars]
+            self._pos += len(encoded)
+            encoded = self._partial + encoded.translate(_WHITESPACE)
+            usable = len(encoded) if self._pos >= len(self._data) else len(encoded) - len(encoded) % 4
+            self._partial = encoded[usable:]
+            chunk += base64.b64decode(encoded[:usable])
+        n = min(size, len(chunk))
+        buffer[:n] = chunk[:n]
+        self._pending = chunk[n:]
+        return n
+
+def _base64_decoded_size(data: str, start: int) -> int:
+    """Tamanho decodificado aproximado, desconsiderando as quebras de linha"""
+    encoded = len(data) - start - sum(data.count(c, start) for c in ' \t\r\n')
+    return encoded * 3 // 4
+
+def _new_key(content_type: str) -> str:
+    """Gerar nome único para o arquivo"""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    unique_id = str(uuid.uuid4())[:8]
+    extension = EXTENSIONS.get(content_type, 'jpg')
+    return f"images/{timestamp}_{unique_id}.{extension}"
+
+def _content_key(digest: str, content_type: str) -> str:
+    """Chave derivada do hash do conteúdo (uploads deduplicados)"""
+    extension = EXTENSIONS.get(content_type, 'jpg')
+    return f"images/sha256/{digest}.{extension}"
+
+def _already_stored(key: str) -> bool:
     """
+    Verifica se a chave já existe: primeiro no LRU local, depois com head_object
+    """
+    with _seen_lock:
+        if key in _seen_keys:
+            _seen_keys.move_to_end(key)
+            return True
+    
     try:
-        # Configurar cliente S3
-        s3_client = boto3.client('s3')
-        
-        # Extrair parâmetros
-        parameters = event.get('parameters', [])
-        image_base64 = None
-        bucket_name = 'document-validation-poc'  # Configurar seu bucket
-        
-        # Buscar parâmetro image_data
-        for param in parameters:
-            if param['name'] == 'image_data':
-                image_base64 = param['value']
+        with metrics.span('s3.head_object'):
+            get_client('s3').head_object(Bucket=BUCKET_NAME, Key=key)
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+            return False
+        raise
+    
+    _remember(key)
+    return True
+
+def _remember(key: str) -> None:
+    with _seen_lock:
+        _seen_keys[key] = True
+        _seen_keys.move_to_end(key)
+        while len(_seen_keys) > SEEN_KEYS_MAX:
+            _seen_keys.popitem(last=False)
+
+def _stored(file_key: str, digest: Optional[str] = None, deduplicated: bool = False,
+            image_info: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    result = {
+        'bucket': BUCKET_NAME,
+        'key': file_key,
+        's3_uri': f"s3://{BUCKET_NAME}/{file_key}"
+    }
+    if digest:
+        result['sha256'] = digest
+        result['deduplicated'] = deduplicated
+    if image_info:
+        result['image'] = image_info
+    return result
+
+def store_image(image_bytes: bytes, content_type: str = 'image/jpeg',
+                deduplicate: Optional[bool] = None, normalize: Optional[bool] = None,
+                image_info: Optional[Dict[str, Any]] = None,
+                check_quality: Optional[bool] = None) -> Dict[str, Any]:
+    """
+    Grava os bytes da imagem no S3 e retorna bucket/key.
+    Com o controle de qualidade, imagens ruins são rejeitadas (ImageQualityError) antes do upload.
+    Com normalização, a imagem é reorientada, reduzida e recomprimida antes do upload.
+    Com deduplicação, a chave é o SHA-256 do conteúdo e imagens repetidas não são reenviadas.
+    PDF/TIFF são gravados como estão, com a extensão e o content type corretos; para TIFF,
+    a primeira página também é gravada em JPEG como foto do documento (face_reference).
+    """
+    if deduplicate is None:
+        deduplicate = DEDUPLICATE_UPLOADS
+    if normalize is None:
+        normalize = NORMALIZE_IMAGES
+    if check_quality is None:
+        check_quality = QUALITY_GATE_ENABLED
+    
+    document_type = detect_document_format(image_bytes)
+    if document_type:
+        content_type = document_type
+        check_quality = normalize = False
+    
+    quality = None
+    if check_quality:
+        with metrics.span('image.quality_gate'):
+            quality = check_image_quality(image_bytes)
+    
+    if normalize:
+        with metrics.span('image.normalize'):
+            image_bytes, content_type, image_info = normalize_image(image_bytes)
+    
+    if quality is not None:
+        image_info = dict(image_info or {}, quality=quality)
+    
+    digest = None
+    if deduplicate:
+        digest = hashlib.sha256(image_bytes).hexdigest()
+        file_key = _content_key(digest, content_type)
+        if _already_stored(file_key):
+            return _stored(file_key, digest, deduplicated=True, image_info=image_info)
+    else:
+        file_key = _new_key(content_type)
+    
+    def put() -> None:
+        # Cliente S3 compartilhado (criado uma vez por processo)
+        with metrics.span('s3.put_object'):
+            response = get_client('s3').put_object(
+                Bucket=BUCKET_NAME,
+                Key=file_key,
+                Body=image_bytes,
+                ContentType=content_type
+            )
+        # Versão conhecida no PUT: a extração não precisa de head_object para o cache
+        remember_version(BUCKET_NAME, file_key, response)
+    
+    if image_store.IN_MEMORY_PIPELINE and not document_type:
+        # Bytes ficam disponíveis no processo; o S3 recebe a cópia em segundo plano.
+        # PDF/TIFF não: o Textract assíncrono lê o objeto direto do S3
+        image_store.remember(BUCKET_NAME, file_key, image_bytes)
+        image_store.upload_in_background(put, BUCKET_NAME, file_key)
+    else:
+        put()
+    
+    if digest:
+        _remember(file_key)
+    stored = _stored(file_key, digest, image_info=image_info)
+    if document_type:
+        face_reference = _store_face_reference(image_bytes, deduplicate)
+        if face_reference:
+            stored['face_reference'] = face_reference
+    return stored
+
+def _store_face_reference(document_bytes: bytes, deduplicate: bool) -> Optional[Dict[str, Any]]:
+    """
+    Foto do documento para o compare_faces (Rekognition não lê PDF/TIFF): a primeira
+    página do TIFF em JPEG, se passar no controle de qualidade. None para PDF.
+    """
+    page = render_first_page(document_bytes)
+    if page is None:
+        return None
+    try:
+        return store_image(page, 'image/jpeg', deduplicate)
+    except ImageQualityError:
+        return None
+
+def store_image_base64(image_base64: str, content_type: str = 'image/jpeg',
+                       deduplicate: Optional[bool] = None, normalize: Optional[bool] = None) -> Dict[str, Any]:
+    """
+    Grava uma imagem em base64 (com ou sem prefixo data:) no S3.
+    Imagens pequenas vão em um único PUT; as grandes são decodificadas em
+    blocos e enviadas por multipart upload com memória limitada.
+    """
+    if normalize is None:
+        normalize = NORMALIZE_IMAGES
+    
+    # Pular o prefixo data:image/...; sem copiar a string
+    start = image_base64.find(',') + 1
+    decoded_size = _base64_decoded_size(image_base64, start)
+    
+    if decoded_size < MULTIPART_THRESHOLD:
+        with metrics.span('image.base64_decode'):
+            image_bytes = base64.b64decode(image_base64[start:])
+        return store_image(image_bytes, content_type, deduplicate, normalize)
+    
+    header = Base64Reader(image_base64, start).read(12)
+    document_type = detect_document_format(header)
+    if document_type:
+        # PDF/TIFF: enviados como estão (multipart), sem controle de qualidade nem normalização
+        content_type = document_type
+        normalize = False
+    elif QUALITY_GATE_ENABLED:
+        # Imagem grande: formato (bytes iniciais) e tamanho verificados antes de decodificar
+        check_image_quality(header, size=decoded_size)
+    
+    if normalize:
+        # Imagem grande: decodificada direto do stream base64 e reduzida antes do upload
+        reader = io.BufferedReader(Base64Reader(image_base64, start), buffer_size=MULTIPART_CHUNKSIZE)
+        with metrics.span('image.normalize'):
+            image_bytes, content_type, image_info = normalize_image(reader, original_size=decoded_size)
+        return store_image(image_bytes, content_type, deduplicate, normalize=False, image_info=image_info)
+    
+    if deduplicate is None:
+        deduplicate = DEDUPLICATE_UPLOADS
+    
+    digest = None
+    if deduplicate:
+        # Primeira passada em blocos apenas para calcular o hash
+        sha256 = hashlib.sha256()
+        reader = Base64Reader(image_base64, start)
+        buffer = bytearray(MULTIPART_CHUNKSIZE)
+        view = memoryview(buffer)
+        while True:
+            n = reader.readinto(buffer)
+            if not n:
                 break
-                
-        if not image_base64:
-            return {
-                'response': {
-                    'error': 'Parâmetro image_data não encontrado'
-                }
-            }
-        
-        # Remover prefixo data:image/... se existir
-        if ',' in image_base64:
-            image_base64 = image_base64.split(',')[1]
-        
-        # Decodificar base64
-        image_bytes = base64.b64decode(image_base64)
-        
-        # Gerar nome único para o arquivo
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        unique_id = str(uuid.uuid4())[:8]
-        file_key = f"images/{timestamp}_{unique_id}.jpg"
-        
-        # Upload para S3
-        s3_client.put_object(
-            Bucket=bucket_name,
-            Key=file_key,
-            Body=image_bytes,
-            ContentType='image/jpeg'
+            sha256.update(view[:n])
+        digest = sha256.hexdigest()
+        file_key = _content_key(digest, content_type)
+        if _already_stored(file_key):
+            return _stored(file_key, digest, deduplicated=True)
+    else:
+        file_key = _new_key(content_type)
+    
+    with metrics.span('s3.upload_fileobj'):
+        get_client('s3').upload_fileobj(
+            io.BufferedReader(Base64Reader(image_base64, start), buffer_size=MULTIPART_CHUNKSIZE),
+            BUCKET_NAME,
+            file_key,
+            ExtraArgs={'ContentType': content_type},
+            Config=TRANSFER_CONFIG
         )
+    
+    if digest:
+        _remember(file_key)
+    return _stored(file_key, digest)
+
+@tool(
+    'upload_to_s3',
+    'Faz upload de uma imagem (JPG/PNG) ou documento (PDF/TIFF) em base64 para o S3 '
+    '(arquivos enviados pelo cliente já chegam como s3://)',
+    parameters=[
+        Parameter('image_data', 'string', 'Imagem ou PDF/TIFF codificado em base64 (somente quando não houver '
+                  'referência s3://)'),
+        Parameter('deduplicate', 'boolean', 'Opcional: reutilizar a imagem se o mesmo conteúdo já foi enviado',
+                  required=False)
+    ],
+    action_group_description='Ferramenta para upload de imagens para S3'
+)
+def upload_to_s3(params) -> Dict[str, Any]:
+    """
+    Ferramenta 1: Upload de imagem em base64 para S3
+    """
+    try:
+        # Decodificar e enviar para o S3 (PUT único ou multipart por tamanho)
+        stored = store_image_base64(params.image_data, deduplicate=params.deduplicate)
+        s3_uri = stored['s3_uri']
+        
+        response = {
+            'success': True,
+            'bucket': stored['bucket'],
+            'key': stored['key'],
+            's3_uri': s3_uri,
+            'message': f'Imagem uploaded com sucesso para {s3_uri}'
+        }
+        if 'image' in stored:
+            response['image'] = stored['image']
+        if 'sha256' in stored:
+            response['sha256'] = stored['sha256']
+            response['deduplicated'] = stored['deduplicated']
+            if stored['deduplicated']:
+                response['message'] = f'Imagem já existente reutilizada: {s3_uri}'
         
-        # Retornar informações do upload
-        s3_uri = f"s3://{bucket_name}/{file_key}"
+        return {
+            'response': response
+        }
         
+    except ImageQualityError as e:
+        # Rejeitada localmente, sem chamadas à AWS
+        metrics.record_error('upload_to_s3', f'ImageQuality.{e.reason}')
         return {
             'response': {
-                'success': True,
-                'bucket': bucket_name,
-                'key': file_key,
-                's3_uri': s3_uri,
-                'message': f'Imagem uploaded com sucesso para {s3_uri}'
+                'error': str(e),
+                'quality_check': e.reason,
+                'quality': e.quality
             }
         }
         
     except Exception as e:
+        metrics.record_error('upload_to_s3', metrics.error_type(e))
         return {
             'response': {
                 'error': f'Erro ao fazer upload: {str(e)}'
@@ -74,14 +362,4 @@ def upload_to_s3(event: Dict[str, Any]) -> Dict[str, Any]:
 # Função para o Action Group
 def lambda_handler(event, context):
     """Handler principal para o Action Group"""
-    action = event.get('actionGroup', '')
-    function = event.get('function', '')
-    
-    if function == 'upload_to_s3':
-        return upload_to_s3(event)
-    
-    return {
-        'response': {
-            'error': 'Função não encontrada'
-        }
-    }
\ No newline at end of file
+    return tool_registry.dispatch(event)
\ No newline at end of file
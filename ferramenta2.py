@@ -1,144 +1,505 @@
-import boto3
+import hashlib
 import json
-from typing import Dict, Any
+import os
+import time
+from typing import Dict, Any, List, Tuple, Iterable, Iterator, Optional
+import multiprocessing
 import re
+import unicodedata
+from functools import lru_cache
 
-def extract_text_from_document(event: Dict[str, Any]) -> Dict[str, Any]:
+import image_store
+import metrics
+import resilience
+import tool_registry
+from aws_clients import get_client
+from image_preprocessing import DOCUMENT_EXTENSIONS
+from textract_cache import get_textract_cache, object_version
+from tool_registry import Parameter, tool
+
+FEATURE_TYPES = ['FORMS', 'TABLES']
+
+# Níveis do Textract, do mais barato ao mais caro (None = DetectDocumentText)
+TEXTRACT_TIERS = {
+    'detect': None,
+    'forms': ['FORMS'],
+    'forms_tables': ['FORMS', 'TABLES']
+}
+
+# analyze: sempre AnalyzeDocument com FORMS+TABLES
+# adaptive: sobe de nível (TEXTRACT_ADAPTIVE_TIERS) só enquanto faltarem campos
+TEXTRACT_MODE = os.environ.get('TEXTRACT_MODE', 'analyze')
+TEXTRACT_ADAPTIVE_TIERS = [
+    tier.strip() for tier in os.environ.get('TEXTRACT_ADAPTIVE_TIERS', 'detect,forms').split(',') if tier.strip()
+]
+_unknown_tiers = [tier for tier in TEXTRACT_ADAPTIVE_TIERS if tier not in TEXTRACT_TIERS]
+if _unknown_tiers or not TEXTRACT_ADAPTIVE_TIERS:
+    raise ValueError(
+        f"TEXTRACT_ADAPTIVE_TIERS inválido: {', '.join(_unknown_tiers) or 'vazio'}. "
+        f"Use {', '.join(TEXTRACT_TIERS)}"
+    )
+
+# async: StartDocumentAnalysis + GetDocumentAnalysis paginado (PDF/TIFF com várias páginas).
+# Usado automaticamente para as extensões abaixo.
+TEXTRACT_ASYNC_EXTENSIONS = DOCUMENT_EXTENSIONS
+TEXTRACT_ASYNC_TIMEOUT = float(os.environ.get('TEXTRACT_ASYNC_TIMEOUT', '300'))
+TEXTRACT_ASYNC_POLL_INITIAL = float(os.environ.get('TEXTRACT_ASYNC_POLL_INITIAL', '1'))
+TEXTRACT_ASYNC_POLL_MAX = float(os.environ.get('TEXTRACT_ASYNC_POLL_MAX', '10'))
+TEXTRACT_ASYNC_MAX_RESULTS = int(os.environ.get('TEXTRACT_ASYNC_MAX_RESULTS', '1000'))
+
+# Chaves do FORMS (normalizadas) mapeadas para os campos extraídos
+FORM_FIELDS = {
+    'NOME': 'nome',
+    'NOME COMPLETO': 'nome',
+    'NOME DO TITULAR': 'nome',
+    'TITULAR': 'nome',
+    'CPF': 'cpf',
+    'CPF DO TITULAR': 'cpf',
+    'DATA DE NASCIMENTO': 'data_nascimento',
+    'DATA NASCIMENTO': 'data_nascimento',
+    'DATA DE NASC': 'data_nascimento',
+    'NASCIMENTO': 'data_nascimento'
+}
+
+@tool(
+    'extract_text_from_document',
+    'Extrai texto e dados específicos de um documento',
+    parameters=[
+        Parameter('bucket', 'string', 'Nome do bucket S3 (parte bucket de s3://bucket/key)'),
+        Parameter('key', 'string', 'Chave do objeto no S3 (parte key de s3://bucket/key)'),
+        Parameter('mode', 'string', 'Opcional: analyze (FORMS+TABLES), adaptive (DetectDocumentText primeiro) '
+                  'ou async (PDF/TIFF com várias páginas)', required=False, default=TEXTRACT_MODE)
+    ],
+    action_group_description='Ferramenta para extrair texto de documentos usando Textract'
+)
+def extract_text_from_document(params) -> Dict[str, Any]:
     """
     Ferramenta 2: Extração de texto de documento usando Textract
     """
     try:
-        # Configurar cliente Textract
-        textract_client = boto3.client('textract')
+        bucket_name = params.bucket
+        object_key = params.key
+        mode = params.mode
         
-        # Extrair parâmetros
-        parameters = event.get('parameters', [])
-        bucket_name = None
-        object_key = None
+        # Documentos com várias páginas só são aceitos pela API assíncrona
+        if object_key.lower().endswith(TEXTRACT_ASYNC_EXTENSIONS):
+            mode = 'async'
         
-        # Buscar parâmetros
-        for param in parameters:
-            if param['name'] == 'bucket':
-                bucket_name = param['value']
-            elif param['name'] == 'key':
-                object_key = param['value']
-        
-        if not bucket_name or not object_key:
+        if mode == 'async':
+            return {
+                'response': extract_text_async(bucket_name, object_key)
+            }
+        elif mode == 'adaptive':
+            tiers = TEXTRACT_ADAPTIVE_TIERS
+        elif mode == 'analyze':
+            tiers = ['forms_tables']
+        else:
             return {
                 'response': {
-                    'error': 'Parâmetros bucket e key são obrigatórios'
+                    'error': f'Modo inválido: {mode}. Use analyze, adaptive ou async'
                 }
             }
         
-        # Analisar documento
-        response = textract_client.analyze_document(
-            Document={
-                'S3Object': {
-                    'Bucket': bucket_name,
-                    'Name': object_key
-                }
-            },
-            FeatureTypes=['FORMS', 'TABLES']
-        )
+        cache = get_textract_cache()
+        version = object_version(bucket_name, object_key) if cache is not None else None
+        cache_tier = None
+        # Prazo único para todos os níveis do Textract desta chamada
+        deadline = resilience.Deadline.for_service('textract')
         
-        # Extrair texto completo
-        extracted_text = ""
-        for block in response['Blocks']:
-            if block['BlockType'] == 'LINE':
-                extracted_text += block['Text'] + " "
+        dados_extraidos: Dict[str, Any] = {}
+        for tier in tiers:
+            response, cache_tier = _run_textract(bucket_name, object_key, TEXTRACT_TIERS[tier], cache, version, deadline)
+            
+            # Extrair texto completo e dados específicos
+            with metrics.span('textract.parse_blocks'):
+                extracted_text, dados_nivel = extract_from_blocks(response['Blocks'])
+            # Campos achados em um nível mais barato são mantidos se o seguinte não os encontrar
+            dados_extraidos = {campo: valor or dados_extraidos.get(campo) for campo, valor in dados_nivel.items()}
+            if all(dados_extraidos.values()):
+                break
         
-        # Extrair dados específicos
-        dados_extraidos = extract_document_data(extracted_text)
+        result = {
+            'success': True,
+            'raw_text': extracted_text,
+            'extracted_data': dados_extraidos,
+            'message': 'Dados extraídos com sucesso do documento',
+            'textract_tier': tier
+        }
+        if cache is not None:
+            result['cache'] = cache.stats(cache_tier)
         
         return {
-            'response': {
-                'success': True,
-                'raw_text': extracted_text.strip(),
-                'extracted_data': dados_extraidos,
-                'message': 'Dados extraídos com sucesso do documento'
-            }
+            'response': result
         }
         
     except Exception as e:
+        metrics.record_error('extract_text_from_document', metrics.error_type(e))
         return {
             'response': {
-                'error': f'Erro ao extrair texto: {str(e)}'
+                'error': resilience.describe_error('textract', e) or f'Erro ao extrair texto: {str(e)}'
             }
         }
 
-def extract_document_data(text: str) -> Dict[str, str]:
+def _run_textract(bucket_name: str, object_key: str, feature_types: Optional[List[str]],
+                  cache, version: Optional[str],
+                  deadline: Optional[resilience.Deadline] = None) -> Tuple[Dict[str, Any], Optional[str]]:
     """
-    Extrai CPF, nome e data de nascimento do texto
+    Executa um nível do Textract (DetectDocumentText ou AnalyzeDocument com as
+    features informadas), consultando antes o cache de resultados. As chamadas
+    são idempotentes e podem usar hedge.
+    """
+    # Consultar cache de resultados (bucket, key, versão do objeto, features)
+    cache_key = None
+    if cache is not None:
+        cache_key = cache.make_key(bucket_name, object_key, version, feature_types or [])
+        response, cache_tier = cache.get(cache_key)
+        if response is not None:
+            return response, cache_tier
+    
+    # Cliente Textract compartilhado (criado uma vez por processo)
+    textract_client = get_client('textract')
+    # Bytes em memória quando disponíveis, senão S3Object
+    document = image_store.image_source(bucket_name, object_key, image_store.TEXTRACT_MAX_BYTES)
+    
+    if feature_types:
+        # Analisar documento
+        with metrics.span('textract.analyze_document'):
+            response = resilience.call(
+                'textract', 'analyze_document',
+                lambda: textract_client.analyze_document(Document=document, FeatureTypes=feature_types),
+                deadline, hedge=True
+            )
+    else:
+        with metrics.span('textract.detect_document_text'):
+            response = resilience.call(
+                'textract', 'detect_document_text',
+                lambda: textract_client.detect_document_text(Document=document),
+                deadline, hedge=True
+            )
+    
+    response.pop('ResponseMetadata', None)
+    if cache is not None:
+        cache.put(cache_key, response)
+    return response, None
+
+def start_document_analysis(bucket_name: str, object_key: str, feature_types: List[str] = FEATURE_TYPES) -> str:
     """
+    Inicia a análise assíncrona e retorna o JobId. O ClientRequestToken deriva do
+    objeto (e da versão), então repetir a chamada reaproveita o mesmo job.
+    """
+    textract_client = get_client('textract')
+    version = object_version(bucket_name, object_key)
+    token = hashlib.sha256(
+        f'{bucket_name}/{object_key}/{version}/{",".join(feature_types)}'.encode('utf-8')
+    ).hexdigest()[:64]
+    
+    with metrics.span('textract.start_document_analysis'):
+        response = resilience.call(
+            'textract', 'start_document_analysis',
+            lambda: textract_client.start_document_analysis(
+                DocumentLocation={'S3Object': {'Bucket': bucket_name, 'Name': object_key}},
+                FeatureTypes=feature_types,
+                ClientRequestToken=token
+            )
+        )
+    return response['JobId']
+
+def iter_analysis_results(job_id: str) -> Iterator[Dict[str, Any]]:
+    """
+    Aguarda o job com intervalos crescentes e gera cada resposta paginada do
+    GetDocumentAnalysis (seguindo o NextToken), sem acumular os blocos
+    """
+    textract_client = get_client('textract')
+    
+    def get_page(**kwargs) -> Dict[str, Any]:
+        with metrics.span('textract.get_document_analysis'):
+            return resilience.call(
+                'textract', 'get_document_analysis',
+                lambda: textract_client.get_document_analysis(
+                    JobId=job_id, MaxResults=TEXTRACT_ASYNC_MAX_RESULTS, **kwargs
+                )
+            )
+    
+    delay = TEXTRACT_ASYNC_POLL_INITIAL
+    deadline = time.monotonic() + TEXTRACT_ASYNC_TIMEOUT
+    response = get_page()
+    while response['JobStatus'] == 'IN_PROGRESS':
+        if time.monotonic() + delay > deadline:
+            raise resilience.DeadlineExceeded('textract', TEXTRACT_ASYNC_TIMEOUT)
+        time.sleep(delay)
+        delay = min(delay * 2, TEXTRACT_ASYNC_POLL_MAX)
+        response = get_page()
+    
+    if response['JobStatus'] == 'FAILED':
+        raise RuntimeError(f"Análise assíncrona do Textract falhou: {response.get('StatusMessage', 'sem detalhes')}")
+    
+    while True:
+        yield response
+        next_token = response.get('NextToken')
+        if not next_token:
+            return
+        response = get_page(NextToken=next_token)
+
+def iter_document_pages(job_id: str) -> Iterator[List[Dict[str, Any]]]:
+    """Blocos agrupados por página do documento, liberados assim que a página termina"""
+    page = None
+    blocks: List[Dict[str, Any]] = []
+    for response in iter_analysis_results(job_id):
+        for block in response['Blocks']:
+            number = block.get('Page', 1)
+            if number != page and blocks:
+                yield blocks
+                blocks = []
+            page = number
+            blocks.append(block)
+    if blocks:
+        yield blocks
+
+def extract_from_pages(pages: Iterable[List[Dict[str, Any]]]) -> Tuple[str, Dict[str, str], int]:
+    """
+    Extração página a página: pares FORMS de cada página preenchem os campos ainda
+    vazios; as regex rodam no fim, sobre o texto de todas as páginas
+    """
+    lines = []
     dados = {
         'cpf': None,
         'nome': None,
         'data_nascimento': None
     }
+    count = 0
     
-    # Padrões regex
-    cpf_pattern = r'\b\d{3}\.?\d{3}\.?\d{3}-?\d{2}\b'
-    data_pattern = r'\b\d{2}[\/\-\.]\d{2}[\/\-\.]\d{4}\b'
-    
-    # Buscar CPF
-    cpf_match = re.search(cpf_pattern, text)
-    if cpf_match:
-        cpf = cpf_match.group()
-        # Normalizar CPF (remover pontos e traços)
-        dados['cpf'] = re.sub(r'[^\d]', '', cpf)
-    
-    # Buscar data de nascimento
-    data_matches = re.findall(data_pattern, text)
-    if data_matches:
-        # Pegar a primeira data encontrada (assumindo que é a data de nascimento)
-        dados['data_nascimento'] = data_matches[0]
-    
-    # Buscar nome (lógica mais complexa - tentar identificar nome próprio)
-    # Procurar por palavras em maiúsculo que possam ser nome
-    palavras = text.split()
-    possivel_nome = []
-    
-    for i, palavra in enumerate(palavras):
-        # Se a palavra está em maiúsculas e tem mais de 2 caracteres
-        if palavra.isupper() and len(palavra) > 2 and palavra.isalpha():
-            possivel_nome.append(palavra)
-            # Pegar próximas palavras em maiúsculo também
-            for j in range(i+1, min(i+4, len(palavras))):
-                if palavras[j].isupper() and palavras[j].isalpha() and len(palavras[j]) > 1:
-                    possivel_nome.append(palavras[j])
-                else:
-                    break
-            break
+    for blocks in pages:
+        count += 1
+        with metrics.span('textract.parse_blocks'):
+            lines.extend(block['Text'] for block in blocks if block['BlockType'] == 'LINE')
+            if not all(dados.values()):
+                for campo, valor in extract_form_fields(blocks).items():
+                    if not dados[campo]:
+                        dados[campo] = valor
+    
+    text = ' '.join(lines)
+    if not all(dados.values()):
+        for campo, valor in extract_document_data(text).items():
+            if not dados[campo]:
+                dados[campo] = valor
     
-    if possivel_nome:
-        dados['nome'] = ' '.join(possivel_nome)
+    return text, dados, count
+
+def extract_text_async(bucket_name: str, object_key: str) -> Dict[str, Any]:
+    """Análise assíncrona de documentos com várias páginas (ex.: frente e verso da CNH)"""
+    job_id = start_document_analysis(bucket_name, object_key)
+    extracted_text, dados_extraidos, pages = extract_from_pages(iter_document_pages(job_id))
+    return {
+        'success': True,
+        'raw_text': extracted_text,
+        'extracted_data': dados_extraidos,
+        'message': f'Dados extraídos com sucesso do documento ({pages} página(s))',
+        'textract_tier': 'async',
+        'job_id': job_id,
+        'pages': pages
+    }
+
+def extract_from_blocks(blocks: List[Dict[str, Any]]) -> Tuple[str, Dict[str, str]]:
+    """
+    Monta o texto das linhas e extrai os dados, priorizando os pares chave/valor
+    do FORMS e usando as regex apenas para os campos que faltarem
+    """
+    text = ' '.join(block['Text'] for block in blocks if block['BlockType'] == 'LINE')
+    
+    dados = extract_form_fields(blocks)
+    if not all(dados.values()):
+        for campo, valor in extract_document_data(text).items():
+            if not dados[campo]:
+                dados[campo] = valor
+    
+    return text, dados
+
+@lru_cache(maxsize=4096)
+def _normalize_key(text: str) -> str:
+    """Remove acentos e pontuação de uma chave do formulário"""
+    text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii')
+    return ' '.join(re.sub(r'[^A-Z0-9 ]', ' ', text.upper()).split())
+
+def extract_form_fields(blocks: List[Dict[str, Any]]) -> Dict[str, str]:
+    """
+    Resolve os pares KEY_VALUE_SET do Textract em uma única passada sobre os blocos
+    """
+    dados = {
+        'cpf': None,
+        'nome': None,
+        'data_nascimento': None
+    }
+    
+    # Indexar blocos por Id uma única vez
+    by_id = {block['Id']: block for block in blocks if 'Id' in block}
+    
+    def words(block: Dict[str, Any]) -> str:
+        texts = []
+        for rel in block.get('Relationships', ()):
+            if rel['Type'] == 'CHILD':
+                for block_id in rel['Ids']:
+                    child = by_id.get(block_id)
+                    if child is not None and child['BlockType'] == 'WORD':
+                        texts.append(child['Text'])
+        return ' '.join(texts)
+    
+    pendentes = len(dados)
+    for block in blocks:
+        if block['BlockType'] != 'KEY_VALUE_SET' or 'KEY' not in block.get('EntityTypes', ()):
+            continue
+        
+        campo = FORM_FIELDS.get(_normalize_key(words(block)))
+        if campo is None or dados[campo]:
+            continue
+        
+        valor = ' '.join(
+            words(by_id[value_id])
+            for rel in block.get('Relationships', ())
+            if rel['Type'] == 'VALUE'
+            for value_id in rel['Ids']
+            if value_id in by_id
+        ).strip()
+        if not valor:
+            continue
+        
+        if campo == 'cpf':
+            cpf = re.sub(r'[^\d]', '', valor)
+            dados['cpf'] = cpf if cpf_valido(cpf) else None
+        elif campo == 'data_nascimento':
+            data_match = re.search(r'\d{2}[\/\-\.]\d{2}[\/\-\.]\d{4}', valor)
+            dados['data_nascimento'] = data_match.group() if data_match else None
+        else:
+            dados['nome'] = valor
+        
+        if dados[campo]:
+            pendentes -= 1
+            if not pendentes:
+                break
+    
+    return dados
+
+def cpf_valido(cpf: str) -> bool:
+    """
+    Valida os dígitos verificadores de um CPF com 11 dígitos
+    """
+    if len(cpf) != 11 or cpf == cpf[0] * 11:
+        return False
+    for n in (9, 10):
+        total = sum(int(cpf[i]) * (n + 1 - i) for i in range(n))
+        if (total * 10) % 11 % 10 != int(cpf[n]):
+            return False
+    return True
+
+class DocumentDataExtractor:
+    """
+    Extrator de CPF, nome e data de nascimento com padrões pré-compilados.
+    O texto é percorrido uma única vez por um padrão combinado.
+    """
+    # CPF, data ou palavra alfabética isolada (candidata a nome)
+    TOKEN_PATTERN = re.compile(
+        r'(?P<cpf>\b\d{3}\.?\d{3}\.?\d{3}-?\d{2}\b)'
+        r'|(?P<data>\b\d{2}[\/\-\.]\d{2}[\/\-\.]\d{4}\b)'
+        r'|(?P<palavra>(?<!\S)[^\W\d_]{3,}(?!\S))'
+    )
+    NEXT_WORD_PATTERN = re.compile(r'\s+(\S+)')
+    NON_DIGIT_PATTERN = re.compile(r'[^\d]')
     
     # Se não encontrou nome em maiúsculo, procurar padrão "NOME:" ou similar
-    nome_patterns = [
-        r'NOME[:\s]+([A-Z\s]{10,50})',
-        r'NOME COMPLETO[:\s]+([A-Z\s]{10,50})',
-        r'TITULAR[:\s]+([A-Z\s]{10,50})'
+    NOME_PATTERNS = [
+        re.compile(r'NOME[:\s]+([A-Z\s]{10,50})'),
+        re.compile(r'NOME COMPLETO[:\s]+([A-Z\s]{10,50})'),
+        re.compile(r'TITULAR[:\s]+([A-Z\s]{10,50})')
     ]
     
-    for pattern in nome_patterns:
-        match = re.search(pattern, text)
-        if match and not dados['nome']:
-            dados['nome'] = match.group(1).strip()
-            break
+    def __init__(self, validate_cpf: bool = True):
+        self.validate_cpf = validate_cpf
     
-    return dados
+    def extract(self, text: str) -> Dict[str, str]:
+        """
+        Extrai CPF, nome e data de nascimento do texto
+        """
+        dados = {
+            'cpf': None,
+            'nome': None,
+            'data_nascimento': None
+        }
+        pendentes = 3
+        
+        for match in self.TOKEN_PATTERN.finditer(text):
+            grupo = match.lastgroup
+            
+            if grupo == 'cpf':
+                if dados['cpf']:
+                    continue
+                # Normalizar CPF (remover pontos e traços)
+                cpf = self.NON_DIGIT_PATTERN.sub('', match.group())
+                if self.validate_cpf and not cpf_valido(cpf):
+                    continue
+                dados['cpf'] = cpf
+            
+            elif grupo == 'data':
+                if dados['data_nascimento']:
+                    continue
+                # Primeira data encontrada (assumindo que é a data de nascimento)
+                dados['data_nascimento'] = match.group()
+            
+            else:
+                palavra = match.group()
+                if dados['nome'] or not palavra.isupper():
+                    continue
+                dados['nome'] = self._nome_a_partir_de(text, palavra, match.end())
+            
+            pendentes -= 1
+            if not pendentes:
+                break
+        
+        if not dados['nome']:
+            for pattern in self.NOME_PATTERNS:
+                match = pattern.search(text)
+                if match:
+                    dados['nome'] = match.group(1).strip()
+                    break
+        
+        return dados
+    
+    def extract_many(self, texts: Iterable[str], processes: Optional[int] = None,
+                     chunksize: int = 1000) -> Iterator[Dict[str, str]]:
+        """
+        Extrai os dados de vários textos (ex.: raw_text armazenado), preservando a ordem.
+        Com processes > 1 o trabalho é distribuído em um pool de processos.
+        """
+        if not processes or processes <= 1:
+            return map(self.extract, texts)
+        
+        return self._extract_pool(texts, processes, chunksize)
+    
+    def _extract_pool(self, texts: Iterable[str], processes: int, chunksize: int) -> Iterator[Dict[str, str]]:
+        with multiprocessing.Pool(processes) as pool:
+            yield from pool.imap(self.extract, texts, chunksize)
+    
+    def _nome_a_partir_de(self, text: str, primeira: str, pos: int) -> str:
+        """Pegar até 3 palavras seguintes em maiúsculo"""
+        possivel_nome = [primeira]
+        for _ in range(3):
+            match = self.NEXT_WORD_PATTERN.match(text, pos)
+            if not match:
+                break
+            palavra = match.group(1)
+            if not (palavra.isupper() and palavra.isalpha() and len(palavra) > 1):
+                break
+            possivel_nome.append(palavra)
+            pos = match.end()
+        return ' '.join(possivel_nome)
+
+_extractor = DocumentDataExtractor()
+
+def extract_document_data(text: str) -> Dict[str, str]:
+    """
+    Extrai CPF, nome e data de nascimento do texto
+    """
+    return _extractor.extract(text)
 
 # Função para o Action Group
 def lambda_handler(event, context):
     """Handler principal para o Action Group"""
-    action = event.get('actionGroup', '')
-    function = event.get('function', '')
-    
-    if function == 'extract_text_from_document':
-        return extract_text_from_document(event)
-    
-    return {
-        'response': {
-            'error': 'Função não encontrada'
-        }
-    }
\ No newline at end of file
+    return tool_registry.dispatch(event)
\ No newline at end of file
@@ -1,59 +1,196 @@
-import boto3
+import io
 import json
-from typing import Dict, Any
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
 
-def compare_faces(event: Dict[str, Any]) -> Dict[str, Any]:
+from botocore.exceptions import ClientError
+
+import image_store
+import metrics
+import resilience
+import tool_registry
+from aws_clients import get_client
+from image_preprocessing import DOCUMENT_EXTENSIONS
+from tool_registry import Parameter, tool
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+# Recorte da face do documento usado como SourceImage no compare_faces
+FACE_CROP_ENABLED = os.environ.get('FACE_CROP_ENABLED', '1') == '1'
+FACE_CROP_MARGIN = float(os.environ.get('FACE_CROP_MARGIN', '0.4'))
+FACE_CROP_CACHE_SIZE = int(os.environ.get('FACE_CROP_CACHE_SIZE', '256'))
+FACE_CROP_PREFIX = 'faces/'
+
+# Documento sem face detectada: guardado no LRU para não repetir o DetectFaces a cada selfie
+_NO_FACE = b''
+
+_face_crops: 'OrderedDict[Tuple[str, str], bytes]' = OrderedDict()
+_face_crops_lock = threading.Lock()
+
+def _read_image(bucket: str, key: str) -> bytes:
+    data = image_store.get(bucket, key)
+    if data is None:
+        image_store.wait_for_upload(bucket, key)
+        with metrics.span('s3.get_object'):
+            data = get_client('s3').get_object(Bucket=bucket, Key=key)['Body'].read()
+    return data
+
+def _crop_largest_face(data: bytes, faces) -> Optional[bytes]:
+    """Recorta a maior face (o retrato do documento) com margem ao redor"""
+    box = max((face['BoundingBox'] for face in faces), key=lambda b: b['Width'] * b['Height'])
+    # BoundingBox do Rekognition é relativa à imagem já orientada pelo EXIF
+    image = ImageOps.exif_transpose(Image.open(io.BytesIO(data)))
+    width, height = image.size
+    
+    margin_x = box['Width'] * FACE_CROP_MARGIN
+    margin_y = box['Height'] * FACE_CROP_MARGIN
+    left = max(0.0, box['Left'] - margin_x) * width
+    top = max(0.0, box['Top'] - margin_y) * height
+    right = min(1.0, box['Left'] + box['Width'] + margin_x) * width
+    bottom = min(1.0, box['Top'] + box['Height'] + margin_y) * height
+    
+    crop = image.crop((int(left), int(top), int(right), int(bottom))).convert('RGB')
+    output = io.BytesIO()
+    crop.save(output, format='JPEG', quality=90)
+    return output.getvalue()
+
+def get_document_face_crop(bucket: str, key: str,
+                           deadline: Optional[resilience.Deadline] = None) -> Optional[bytes]:
+    """
+    Recorte da face do documento: LRU local, depois o recorte já gravado no S3
+    (faces/<key>) e, por fim, get_face_details + recorte, feito uma vez por documento.
+    Retorna None quando não for possível recortar (sem Pillow ou sem face); a ausência
+    de face também fica no LRU.
+    """
+    if Image is None:
+        return None
+    
+    cache_key = (bucket, key)
+    with _face_crops_lock:
+        crop = _face_crops.get(cache_key)
+        if crop is not None:
+            _face_crops.move_to_end(cache_key)
+            return crop or None
+    
+    s3_client = get_client('s3')
+    crop_key = FACE_CROP_PREFIX + key
+    try:
+        with metrics.span('s3.get_object'):
+            crop = s3_client.get_object(Bucket=bucket, Key=crop_key)['Body'].read()
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') not in ('NoSuchKey', '404'):
+            raise
+        
+        params = tool_registry.get_tool('get_face_details').make(bucket=bucket, key=key, attributes='DEFAULT')
+        details = get_face_details(params, deadline)['response']
+        if 'error' in details:
+            # Falha transitória do DetectFaces: não guardar, a próxima comparação tenta de novo
+            return None
+        if not details.get('faces_detected'):
+            crop = _NO_FACE
+        else:
+            image = _read_image(bucket, key)
+            with metrics.span('image.face_crop'):
+                crop = _crop_largest_face(image, details['face_details'])
+            try:
+                with metrics.span('s3.put_object'):
+                    s3_client.put_object(Bucket=bucket, Key=crop_key, Body=crop, ContentType='image/jpeg')
+            except Exception:
+                # Sem a cópia no S3 o recorte continua válido: fica no LRU para as próximas comparações
+                metrics.record_error('compare_faces', 'FaceCropStoreFailed')
+    
+    with _face_crops_lock:
+        _face_crops[cache_key] = crop
+        while len(_face_crops) > FACE_CROP_CACHE_SIZE:
+            _face_crops.popitem(last=False)
+    return crop or None
+
+@tool(
+    'compare_faces',
+    'Compara faces entre duas imagens',
+    parameters=[
+        Parameter('source_bucket', 'string', 'Bucket da referência s3:// do documento'),
+        Parameter('source_key', 'string', 'Chave da referência s3:// do documento'),
+        Parameter('target_bucket', 'string', 'Bucket da referência s3:// da selfie'),
+        Parameter('target_key', 'string', 'Chave da referência s3:// da selfie')
+    ],
+    action_group_description='Ferramenta para comparar faces usando Rekognition'
+)
+def compare_faces(params) -> Dict[str, Any]:
     """
     Ferramenta 3: Comparação de faces usando Rekognition
     """
     try:
-        # Configurar cliente Rekognition
-        rekognition_client = boto3.client('rekognition')
-        
-        # Extrair parâmetros
-        parameters = event.get('parameters', [])
-        source_bucket = None
-        source_key = None
-        target_bucket = None
-        target_key = None
-        
-        # Buscar parâmetros
-        for param in parameters:
-            if param['name'] == 'source_bucket':
-                source_bucket = param['value']
-            elif param['name'] == 'source_key':
-                source_key = param['value']
-            elif param['name'] == 'target_bucket':
-                target_bucket = param['value']
-            elif param['name'] == 'target_key':
-                target_key = param['value']
-        
-        if not all([source_bucket, source_key, target_bucket, target_key]):
+        # Cliente Rekognition compartilhado (criado uma vez por processo)
+        rekognition_client = get_client('rekognition')
+        
+        source_bucket, source_key = params.source_bucket, params.source_key
+        target_bucket, target_key = params.target_bucket, params.target_key
+        
+        if source_key.lower().endswith(DOCUMENT_EXTENSIONS):
+            # Rekognition só aceita JPG/PNG: sem esta verificação o erro seria de formato inválido
+            metrics.record_error('compare_faces', 'DocumentNotImage')
             return {
                 'response': {
-                    'error': 'Todos os parâmetros são obrigatórios: source_bucket, source_key, target_bucket, target_key'
+                    'error': 'O documento em PDF/TIFF não pode ser usado na comparação facial. '
+                             'Use a foto do documento (JPG ou PNG) como origem.'
                 }
             }
         
-        # Comparar faces
-        response = rekognition_client.compare_faces(
-            SourceImage={
-                'S3Object': {
-                    'Bucket': source_bucket,
-                    'Name': source_key
-                }
-            },
-            TargetImage={
-                'S3Object': {
-                    'Bucket': target_bucket,
-                    'Name': target_key
-                }
-            },
-            SimilarityThreshold=80.0  # 80% threshold conforme solicitado
-        )
+        # Bytes em memória quando disponíveis, senão S3Object
+        source_image = image_store.image_source(source_bucket, source_key, image_store.REKOGNITION_MAX_BYTES)
+        target_image = image_store.image_source(target_bucket, target_key, image_store.REKOGNITION_MAX_BYTES)
+        
+        # Prazo único para o recorte e as comparações desta chamada
+        deadline = resilience.Deadline.for_service('rekognition')
+        
+        # Preferir o recorte da face do documento (menor e sem texto ao redor)
+        face_crop = None
+        if FACE_CROP_ENABLED:
+            try:
+                face_crop = get_document_face_crop(source_bucket, source_key, deadline)
+            except Exception:
+                face_crop = None
+        
+        response = None
+        if face_crop is not None:
+            try:
+                with metrics.span('rekognition.compare_faces'):
+                    response = resilience.call(
+                        'rekognition', 'compare_faces',
+                        lambda: rekognition_client.compare_faces(
+                            SourceImage={'Bytes': face_crop},
+                            TargetImage=target_image,
+                            SimilarityThreshold=80.0
+                        ),
+                        deadline, hedge=True
+                    )
+            except rekognition_client.exceptions.InvalidParameterException:
+                # Nenhuma face no recorte: comparar com o documento inteiro
+                metrics.record_error('compare_faces', 'FaceCropFallback')
+                face_crop = None
+        
+        if response is None:
+            # Comparar faces
+            with metrics.span('rekognition.compare_faces'):
+                response = resilience.call(
+                    'rekognition', 'compare_faces',
+                    lambda: rekognition_client.compare_faces(
+                        SourceImage=source_image,
+                        TargetImage=target_image,
+                        SimilarityThreshold=80.0  # 80% threshold conforme solicitado
+                    ),
+                    deadline, hedge=True
+                )
         
         # Analisar resultado
         face_matches = response.get('FaceMatches', [])
+        source_face_crop = face_crop is not None
         
         if face_matches:
             # Pegar a maior similaridade encontrada
@@ -70,6 +207,7 @@ def compare_faces(event: Dict[str, Any]) -> Dict[str, Any]:
                     'similarity': round(similarity, 2),
                     'threshold': 80.0,
                     'face_matches_found': len(face_matches),
+                    'source_face_crop': source_face_crop,
                     'message': f'Comparação realizada. Similaridade: {similarity:.2f}%. {"Validado" if validated else "Não validado"}'
                 }
             }
@@ -81,6 +219,7 @@ def compare_faces(event: Dict[str, Any]) -> Dict[str, Any]:
                     'similarity': 0.0,
                     'threshold': 80.0,
                     'face_matches_found': 0,
+                    'source_face_crop': source_face_crop,
                     'message': 'Nenhuma correspondência facial encontrada acima do threshold de 80%'
                 }
             }
@@ -88,8 +227,16 @@ def compare_faces(event: Dict[str, Any]) -> Dict[str, Any]:
     except Exception as e:
         # Tratar erros específicos do Rekognition
         error_message = str(e)
+        metrics.record_error('compare_faces', metrics.error_type(e))
         
-        if 'InvalidImageFormatException' in error_message:
+        resilience_message = resilience.describe_error('rekognition', e)
+        if resilience_message:
+            return {
+                'response': {
+                    'error': resilience_message
+                }
+            }
+        elif 'InvalidImageFormatException' in error_message:
             return {
                 'response': {
                     'error': 'Formato de imagem inválido. Use JPG ou PNG.'
@@ -114,39 +261,31 @@ def compare_faces(event: Dict[str, Any]) -> Dict[str, Any]:
                 }
             }
 
-def get_face_details(event: Dict[str, Any]) -> Dict[str, Any]:
+@tool(
+    'get_face_details',
+    'Detecta as faces de uma imagem e retorna posição, qualidade e atributos de cada uma',
+    parameters=[
+        Parameter('bucket', 'string', 'Bucket da referência s3:// da imagem'),
+        Parameter('key', 'string', 'Chave da referência s3:// da imagem'),
+        Parameter('attributes', 'string', 'Opcional: ALL (padrão) ou DEFAULT', required=False, default='ALL')
+    ],
+    action_group_description='Ferramenta para detectar faces usando Rekognition'
+)
+def get_face_details(params, deadline: Optional[resilience.Deadline] = None) -> Dict[str, Any]:
     """
     Função auxiliar para detectar faces em uma imagem
     """
     try:
-        rekognition_client = boto3.client('rekognition')
-        
-        parameters = event.get('parameters', [])
-        bucket = None
-        key = None
+        rekognition_client = get_client('rekognition')
+        attributes = params.attributes
         
-        for param in parameters:
-            if param['name'] == 'bucket':
-                bucket = param['value']
-            elif param['name'] == 'key':
-                key = param['value']
-        
-        if not bucket or not key:
-            return {
-                'response': {
-                    'error': 'Parâmetros bucket e key são obrigatórios'
-                }
-            }
-        
-        response = rekognition_client.detect_faces(
-            Image={
-                'S3Object': {
-                    'Bucket': bucket,
-                    'Name': key
-                }
-            },
-            Attributes=['ALL']
-        )
+        image = image_store.image_source(params.bucket, params.key, image_store.REKOGNITION_MAX_BYTES)
+        with metrics.span('rekognition.detect_faces'):
+            response = resilience.call(
+                'rekognition', 'detect_faces',
+                lambda: rekognition_client.detect_faces(Image=image, Attributes=[attributes]),
+                deadline or resilience.Deadline.for_service('rekognition'), hedge=True
+            )
         
         faces = response.get('FaceDetails', [])
         
@@ -160,25 +299,14 @@ def get_face_details(event: Dict[str, Any]) -> Dict[str, Any]:
         }
         
     except Exception as e:
+        metrics.record_error('get_face_details', metrics.error_type(e))
         return {
             'response': {
-                'error': f'Erro ao detectar faces: {str(e)}'
+                'error': resilience.describe_error('rekognition', e) or f'Erro ao detectar faces: {str(e)}'
             }
         }
 
 # Função para o Action Group
 def lambda_handler(event, context):
     """Handler principal para o Action Group"""
-    action = event.get('actionGroup', '')
-    function = event.get('function', '')
-    
-    if function == 'compare_faces':
-        return compare_faces(event)
-    elif function == 'get_face_details':
-        return get_face_details(event)
-    
-    return {
-        'response': {
-            'error': 'Função não encontrada'
-        }
-    }
\ No newline at end of file
+    return tool_registry.dispatch(event)
\ No newline at end of file
@@ -0,0 +1,244 @@
+import io
+import os
+from typing import Dict, Any, Optional, Tuple, Union, BinaryIO
+
+# Pillow é opcional: sem ele, apenas o formato real é detectado (sem redimensionar)
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+    ImageOps = None
+
+# NumPy é opcional: sem ele, o controle de qualidade não calcula nitidez e brilho
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Normalização antes do upload: orientação EXIF, redimensionamento e recompressão
+NORMALIZE_IMAGES = os.environ.get('IMAGE_NORMALIZE', '1') == '1'
+MAX_DIMENSION = int(os.environ.get('IMAGE_MAX_DIMENSION', '2048'))
+JPEG_QUALITY = int(os.environ.get('IMAGE_JPEG_QUALITY', '85'))
+
+EXIF_ORIENTATION = 0x0112
+
+# Controle de qualidade local, antes de qualquer chamada à AWS
+QUALITY_GATE_ENABLED = os.environ.get('IMAGE_QUALITY_GATE', '1') == '1'
+QUALITY_MIN_BYTES = int(os.environ.get('IMAGE_QUALITY_MIN_BYTES', str(10 * 1024)))
+QUALITY_MAX_BYTES = int(os.environ.get('IMAGE_QUALITY_MAX_BYTES', str(15 * 1024 * 1024)))
+QUALITY_MIN_DIMENSION = int(os.environ.get('IMAGE_QUALITY_MIN_DIMENSION', '320'))
+# Variância do laplaciano na imagem reduzida para QUALITY_ANALYSIS_SIZE
+QUALITY_MIN_SHARPNESS = float(os.environ.get('IMAGE_QUALITY_MIN_SHARPNESS', '15'))
+# Brilho médio em tons de cinza (0-255)
+QUALITY_MIN_BRIGHTNESS = float(os.environ.get('IMAGE_QUALITY_MIN_BRIGHTNESS', '40'))
+QUALITY_MAX_BRIGHTNESS = float(os.environ.get('IMAGE_QUALITY_MAX_BRIGHTNESS', '245'))
+QUALITY_ANALYSIS_SIZE = 512
+
+# Documentos com várias páginas: extração pelo Textract assíncrono; não servem como
+# imagem de origem do Rekognition (compare_faces exige JPG/PNG)
+DOCUMENT_EXTENSIONS = ('.pdf', '.tif', '.tiff')
+
+PIL_FORMATS = {
+    'JPEG': 'image/jpeg',
+    'PNG': 'image/png'
+}
+
+
+def detect_format(data: bytes) -> Optional[str]:
+    """Formato real da imagem pelos bytes iniciais (não pela extensão ou prefixo data:)"""
+    if data[:3] == b'\xff\xd8\xff':
+        return 'image/jpeg'
+    if data[:8] == b'\x89PNG\r\n\x1a\n':
+        return 'image/png'
+    return None
+
+
+def detect_document_format(data: bytes) -> Optional[str]:
+    """
+    PDF ou TIFF (documentos com várias páginas) pelos bytes iniciais. Esses arquivos vão
+    para o S3 como estão, sem controle de qualidade nem normalização, e são lidos pelo
+    Textract assíncrono.
+    """
+    if data[:5] == b'%PDF-':
+        return 'application/pdf'
+    if data[:4] in (b'II*\x00', b'MM\x00*'):
+        return 'image/tiff'
+    return None
+
+
+def render_first_page(data: bytes) -> Optional[bytes]:
+    """
+    Primeira página de um TIFF em JPEG, usada como foto do documento na comparação
+    facial. None para PDF (sem renderizador) ou sem Pillow.
+    """
+    if Image is None or detect_document_format(data) != 'image/tiff':
+        return None
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.seek(0)
+        output = io.BytesIO()
+        image.convert('RGB').save(output, format='JPEG', quality=90)
+        return output.getvalue()
+    except Exception:
+        return None
+
+
+class ImageQualityError(ValueError):
+    """Imagem rejeitada pelo controle de qualidade (reason: format, file_size, dimensions, blur, dark, bright)"""
+    
+    def __init__(self, message: str, reason: str, quality: Optional[Dict[str, Any]] = None):
+        super().__init__(message)
+        self.reason = reason
+        self.quality = quality or {}
+
+
+def _sharpness_and_brightness(image) -> Tuple[float, float]:
+    """Variância do laplaciano (nitidez) e brilho médio, vetorizados com NumPy"""
+    gray = image.convert('L')
+    gray.thumbnail((QUALITY_ANALYSIS_SIZE, QUALITY_ANALYSIS_SIZE))
+    pixels = np.asarray(gray, dtype=np.float32)
+    laplacian = (pixels[1:-1, 2:] + pixels[1:-1, :-2] + pixels[2:, 1:-1] + pixels[:-2, 1:-1]
+                 - 4 * pixels[1:-1, 1:-1])
+    return float(laplacian.var()), float(pixels.mean())
+
+
+def check_image_quality(data: bytes, size: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Verificação local e barata da imagem: formato real, tamanho do arquivo, dimensões,
+    nitidez e brilho. Retorna as medidas ou lança ImageQualityError com o motivo.
+    Com `size`, data é apenas o início do arquivo: só formato e tamanho são verificados.
+    """
+    partial = size is not None
+    size = len(data) if size is None else size
+    quality: Dict[str, Any] = {'bytes': size}
+    
+    content_type = detect_format(data)
+    if content_type is None:
+        raise ImageQualityError('Formato de imagem inválido. Use JPG ou PNG.', 'format', quality)
+    quality['format'] = content_type
+    
+    if size < QUALITY_MIN_BYTES:
+        raise ImageQualityError(
+            f'Arquivo de imagem muito pequeno ({size} bytes). Envie uma foto com mais resolução.',
+            'file_size', quality
+        )
+    if size > QUALITY_MAX_BYTES:
+        raise ImageQualityError(
+            f'Arquivo de imagem muito grande ({size / 1024 / 1024:.1f} MB). '
+            f'O limite é {QUALITY_MAX_BYTES / 1024 / 1024:.0f} MB.',
+            'file_size', quality
+        )
+    
+    if Image is None or partial:
+        return quality
+    
+    try:
+        image = Image.open(io.BytesIO(data))
+    except Exception:
+        raise ImageQualityError('Formato de imagem inválido. Use JPG ou PNG.', 'format', quality)
+    
+    # Dimensões vêm do cabeçalho, sem decodificar a imagem
+    width, height = image.size
+    quality['width'] = width
+    quality['height'] = height
+    if min(width, height) < QUALITY_MIN_DIMENSION:
+        raise ImageQualityError(
+            f'Imagem muito pequena ({width}x{height}). Envie uma foto com pelo menos '
+            f'{QUALITY_MIN_DIMENSION}px no menor lado.',
+            'dimensions', quality
+        )
+    
+    if np is None:
+        return quality
+    
+    if image.format == 'JPEG':
+        # Decodificar já reduzida (DCT): a análise não precisa da resolução completa
+        image.draft('L', (QUALITY_ANALYSIS_SIZE, QUALITY_ANALYSIS_SIZE))
+    try:
+        sharpness, brightness = _sharpness_and_brightness(image)
+    except Exception:
+        raise ImageQualityError('Imagem corrompida ou incompleta. Envie a foto novamente.', 'format', quality)
+    quality['sharpness'] = round(sharpness, 1)
+    quality['brightness'] = round(brightness, 1)
+    
+    if brightness < QUALITY_MIN_BRIGHTNESS:
+        raise ImageQualityError(
+            'Imagem muito escura. Tire a foto em um local bem iluminado.', 'dark', quality
+        )
+    if brightness > QUALITY_MAX_BRIGHTNESS:
+        raise ImageQualityError(
+            'Imagem muito clara ou com reflexo. Evite luz direta e flash sobre o documento.', 'bright', quality
+        )
+    if sharpness < QUALITY_MIN_SHARPNESS:
+        raise ImageQualityError(
+            'Imagem desfocada. Envie uma foto nítida, com o documento em foco.', 'blur', quality
+        )
+    
+    return quality
+
+
+def normalize_image(source: Union[bytes, BinaryIO], original_size: Optional[int] = None) -> Tuple[bytes, str, Dict[str, Any]]:
+    """
+    Detecta o formato, aplica a orientação EXIF, reduz para MAX_DIMENSION e
+    recomprime em JPEG. Imagens já adequadas são mantidas como estão.
+    Retorna (bytes, content_type, informações de tamanho original vs gravado).
+    """
+    data = source if isinstance(source, (bytes, bytearray)) else None
+    if original_size is None and data is not None:
+        original_size = len(data)
+
+    if Image is None:
+        if data is None:
+            data = source.read()
+        content_type = detect_format(data) or 'image/jpeg'
+        return data, content_type, {
+            'original_bytes': len(data),
+            'stored_bytes': len(data),
+            'format': content_type,
+            'normalized': False
+        }
+
+    try:
+        image = Image.open(io.BytesIO(data) if data is not None else source)
+    except Exception:
+        raise ValueError('Formato de imagem inválido. Use JPG ou PNG.')
+
+    content_type = PIL_FORMATS.get(image.format)
+    if content_type is None:
+        raise ValueError(f'Formato de imagem não suportado: {image.format}. Use JPG ou PNG.')
+
+    width, height = image.size
+    orientation = image.getexif().get(EXIF_ORIENTATION, 1)
+
+    # Já adequada: mantém os bytes originais
+    if data is not None and orientation == 1 and max(width, height) <= MAX_DIMENSION:
+        return bytes(data), content_type, {
+            'original_bytes': original_size,
+            'stored_bytes': original_size,
+            'format': content_type,
+            'width': width,
+            'height': height,
+            'normalized': False
+        }
+
+    if image.format == 'JPEG':
+        # Decodificar já em escala reduzida (DCT), poupando memória e tempo
+        image.draft('RGB', (MAX_DIMENSION, MAX_DIMENSION))
+
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((MAX_DIMENSION, MAX_DIMENSION), Image.LANCZOS)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    output = io.BytesIO()
+    image.save(output, format='JPEG', quality=JPEG_QUALITY, optimize=True)
+    normalized = output.getvalue()
+
+    return normalized, 'image/jpeg', {
+        'original_bytes': original_size,
+        'stored_bytes': len(normalized),
+        'format': content_type,
+        'width': image.width,
+        'height': image.height,
+        'normalized': True
+    }
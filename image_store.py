@@ -0,0 +1,118 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Dict, Any, Optional, Callable, Tuple
+
+# Pipeline em memória: dentro do mesmo processo (ex.: DocumentValidationAgent), as
+# imagens recém-gravadas ficam disponíveis como bytes para Textract/Rekognition,
+# evitando reler do S3. O upload para o S3 segue em segundo plano, para auditoria.
+
+IN_MEMORY_PIPELINE = os.environ.get('IMAGE_PIPELINE_IN_MEMORY', '0') == '1'
+MAX_STORE_BYTES = int(os.environ.get('IMAGE_STORE_MAX_BYTES', str(64 * 1024 * 1024)))
+
+# Limites do parâmetro Bytes nas APIs síncronas
+TEXTRACT_MAX_BYTES = 10 * 1024 * 1024
+REKOGNITION_MAX_BYTES = 5 * 1024 * 1024
+
+_images: 'OrderedDict[Tuple[str, str], Tuple[bytes, str]]' = OrderedDict()
+_total_bytes = 0
+_lock = threading.Lock()
+_executor: Optional[ThreadPoolExecutor] = None
+# Uploads em andamento por (bucket, key): leituras do S3 aguardam o upload do objeto
+_uploads: Dict[Tuple[str, str], Future] = {}
+
+
+def remember(bucket: str, key: str, data: bytes) -> None:
+    """
+    Guarda os bytes da imagem, descartando as mais antigas acima do limite
+    """
+    global _total_bytes
+    if len(data) > MAX_STORE_BYTES:
+        return
+
+    digest = hashlib.sha256(data).hexdigest()
+    with _lock:
+        previous = _images.pop((bucket, key), None)
+        if previous is not None:
+            _total_bytes -= len(previous[0])
+        _images[(bucket, key)] = (data, digest)
+        _total_bytes += len(data)
+        while _total_bytes > MAX_STORE_BYTES:
+            _, (old, _) = _images.popitem(last=False)
+            _total_bytes -= len(old)
+
+
+def get(bucket: str, key: str) -> Optional[bytes]:
+    with _lock:
+        entry = _images.get((bucket, key))
+        return entry[0] if entry else None
+
+
+def get_digest(bucket: str, key: str) -> Optional[str]:
+    """SHA-256 da imagem guardada (usado como versão do objeto no cache)"""
+    with _lock:
+        entry = _images.get((bucket, key))
+        return entry[1] if entry else None
+
+
+def image_source(bucket: str, key: str, max_bytes: int) -> Dict[str, Any]:
+    """
+    Parâmetro Document/Image para Textract ou Rekognition: Bytes quando a imagem
+    está em memória e cabe no limite da API, senão S3Object
+    """
+    data = get(bucket, key)
+    if data is not None and len(data) <= max_bytes:
+        return {'Bytes': data}
+
+    # Acima do limite da API ou descartada do LRU: o objeto precisa estar no S3
+    wait_for_upload(bucket, key)
+    return {
+        'S3Object': {
+            'Bucket': bucket,
+            'Name': key
+        }
+    }
+
+
+def upload_in_background(upload: Callable[[], Any], bucket: str, key: str) -> Future:
+    """
+    Executa o upload em segundo plano; erros são apenas reportados. Até terminar, o
+    upload fica registrado para wait_for_upload(bucket, key).
+    """
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='s3-upload')
+        future = _executor.submit(upload)
+        _uploads[(bucket, key)] = future
+
+    def report(future: Future) -> None:
+        with _lock:
+            if _uploads.get((bucket, key)) is future:
+                del _uploads[(bucket, key)]
+        error = future.exception()
+        if error is not None:
+            print(f"Erro no upload em segundo plano de {key}: {error}")
+
+    future.add_done_callback(report)
+    return future
+
+
+def wait_for_upload(bucket: str, key: str) -> None:
+    """Aguarda o upload em segundo plano do objeto, se houver, antes de lê-lo do S3"""
+    with _lock:
+        future = _uploads.get((bucket, key))
+    if future is not None:
+        # Falha já reportada em upload_in_background; a leitura do S3 mostrará o erro
+        future.exception()
+
+
+def wait_for_uploads() -> None:
+    """Aguarda os uploads pendentes (ex.: antes de encerrar o processo)"""
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
@@ -0,0 +1,31 @@
+import json
+from typing import Dict, Any
+
+import tool_registry
+# Importar as ferramentas as registra no tool_registry
+import ferramenta1
+import ferramenta2
+import ferramenta3
+
+# Lambda única para todos os action groups (BEDROCK_TOOLS_LAMBDA_ARN em main.py).
+# As ferramentas compartilham o mesmo container: clientes AWS, cache do Textract,
+# recortes de face e circuit breakers ficam aquecidos entre as invocações de qualquer uma.
+
+
+def lambda_handler(event: Dict[str, Any], context) -> Dict[str, Any]:
+    """Executa a ferramenta pedida pelo agente e responde no formato do Action Group"""
+    result = tool_registry.dispatch(event)
+    return {
+        'messageVersion': event.get('messageVersion', '1.0'),
+        'response': {
+            'actionGroup': event.get('actionGroup', ''),
+            'function': event.get('function', ''),
+            'functionResponse': {
+                'responseBody': {
+                    'TEXT': {
+                        'body': json.dumps(result['response'], ensure_ascii=False)
+                    }
+                }
+            }
+        }
+    }
@@ -0,0 +1,151 @@
+import argparse
+import base64
+import io
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+
+# Execução totalmente local com credenciais fictícias. As imagens são JPEGs reais
+# (Pillow), então normalização, controle de qualidade e recorte de face rodam com a
+# configuração padrão.
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'load-test')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'load-test')
+
+from PIL import Image
+
+import ferramenta3
+import image_preprocessing
+import local_aws
+import metrics
+from main import DocumentValidationAgent, ValidationSession
+
+# Gerador de carga do loop chat/returnControl: N usuários simulados percorrem o roteiro
+# documento -> selfie -> validação contra o agente e as ferramentas com AWS local.
+#
+#   python load_test.py --users 200 --concurrency 50 --model-latency-ms 300 --aws-latency-ms 80
+#   python load_test.py --mode orchestrator --aws-latency-ms 80   (fluxo fixo, sem invoke_agent)
+
+SCRIPT = (
+    ('saudacao', lambda images: 'Olá, quero validar meu documento'),
+    ('documento', lambda images: f"Segue meu documento: {images['document']}"),
+    ('selfie', lambda images: f"Segue minha selfie: {images['selfie']}"),
+)
+
+
+# Pares documento/selfie distintos, gerados uma vez antes da carga
+IMAGE_POOL = 8
+
+
+def _jpeg_data_url(width: int, height: int) -> str:
+    """Foto sintética (ruído ampliado, nítida e com brilho médio) aprovada no controle de qualidade"""
+    pixels = os.urandom((width // 8) * (height // 8))
+    image = Image.frombytes('L', (width // 8, height // 8), pixels).resize((width, height)).convert('RGB')
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=85)
+    return 'data:image/jpeg;base64,' + base64.b64encode(buffer.getvalue()).decode()
+
+
+def _image_pool(long_side: int) -> List[Dict[str, str]]:
+    short_side = long_side * 3 // 4
+    return [
+        {'document': _jpeg_data_url(long_side, short_side), 'selfie': _jpeg_data_url(short_side, long_side)}
+        for _ in range(IMAGE_POOL)
+    ]
+
+
+def run_user(agent: DocumentValidationAgent, images: Dict[str, str]) -> Dict[str, float]:
+    """Executa o roteiro completo de um usuário em uma sessão própria"""
+    session = ValidationSession()
+    latencies = {}
+    for step, message in SCRIPT:
+        start = time.perf_counter()
+        response = agent.chat(message(images), session)
+        latencies[step] = (time.perf_counter() - start) * 1000
+        if response.startswith('Erro na conversa'):
+            raise RuntimeError(response)
+    return latencies
+
+
+def run_load(users: int, concurrency: int, model_latency_ms: float = 0.0, aws_latency_ms: float = 0.0,
+             error_rate: float = 0.0, image_px: int = 1600, mode: str = 'agent') -> Dict[str, Any]:
+    fakes = local_aws.install_fake_clients(aws_latency_ms, error_rate)
+    runtime = local_aws.FakeAgentRuntime(model_latency_ms)
+
+    agent = DocumentValidationAgent(mode)
+    agent.bedrock_runtime = runtime
+    agent.agent_id = 'LOCALAGENT'
+    agent.agent_alias_id = 'LOCALALIAS'
+    pool = _image_pool(image_px)
+
+    tracemalloc.start()
+    memory_before = tracemalloc.get_traced_memory()[0]
+
+    samples: Dict[str, List[float]] = {step: [] for step, _ in SCRIPT}
+    failures = 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(run_user, agent, pool[i % len(pool)]) for i in range(users)]
+        for future in futures:
+            try:
+                for step, ms in future.result().items():
+                    samples[step].append(ms)
+            except Exception:
+                failures += 1
+    elapsed = time.perf_counter() - start
+
+    memory_after, memory_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    aws_calls = {}
+    for fake in fakes.values():
+        aws_calls.update(fake.calls)
+
+    return {
+        'mode': mode,
+        'config': {
+            'image_px': image_px,
+            'normalize': image_preprocessing.NORMALIZE_IMAGES,
+            'quality_gate': image_preprocessing.QUALITY_GATE_ENABLED,
+            'face_crop': ferramenta3.FACE_CROP_ENABLED
+        },
+        'users': users,
+        'concurrency': concurrency,
+        'failed_users': failures,
+        'elapsed_s': round(elapsed, 2),
+        'validations_per_s': round((users - failures) / elapsed, 2),
+        'turn_latency_ms': {step: metrics.percentiles(values) for step, values in samples.items() if values},
+        'invoke_agent_calls': runtime.calls,
+        'tool_calls': runtime.tool_calls,
+        'aws_calls': aws_calls,
+        'memory': {
+            'traced_growth_mb': round((memory_after - memory_before) / 1024 / 1024, 2),
+            'traced_peak_mb': round(memory_peak / 1024 / 1024, 2),
+            'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+        }
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='Teste de carga local do DocumentValidationAgent')
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--model-latency-ms', type=float, default=0.0)
+    parser.add_argument('--aws-latency-ms', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--image-px', type=int, default=1600, help='lado maior das imagens geradas')
+    parser.add_argument('--mode', choices=('agent', 'orchestrator'), default='agent')
+    args = parser.parse_args(argv)
+
+    summary = run_load(args.users, args.concurrency, args.model_latency_ms, args.aws_latency_ms,
+                       args.error_rate, args.image_px, args.mode)
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
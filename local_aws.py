@@ -0,0 +1,427 @@
+import random
+import re
+import threading
+import time
+import uuid
+from typing import Dict, Any, Optional
+
+from botocore.exceptions import ClientError
+
+import aws_clients
+
+# Substitutos locais dos clientes S3, Textract, Rekognition e do agente Bedrock (build e runtime),
+# para benchmarks e testes sem acesso à AWS. Respostas realistas, latência injetada e
+# taxa de erros configurável. Os erros são ClientError do botocore, como os do cliente real.
+
+
+def textract_blocks(lines: int = 60, key_every: int = 0) -> Dict[str, Any]:
+    """
+    Resposta do Textract com LINEs, WORDs e pares KEY_VALUE_SET. Com key_every, uma
+    linha a cada key_every também é um par chave/valor; os campos do documento
+    aparecem no final
+    """
+    blocks = []
+    entries = [(f'OBSERVACAO {i}', f'TEXTO LIVRE {i}') if key_every and i % key_every == 0
+               else (None, f'REPUBLICA FEDERATIVA DO BRASIL linha {i}')
+               for i in range(lines)]
+    entries += [('NOME', 'MARIA DA SILVA SANTOS'), ('CPF', '111.444.777-35'), ('DATA DE NASCIMENTO', '01/02/1990')]
+    for i, (key, value) in enumerate(entries):
+        line = f'{key} {value}' if key else value
+        word_ids = [f'w-{i}-{j}' for j in range(len(line.split()))]
+        blocks.append({'BlockType': 'LINE', 'Id': f'line-{i}', 'Text': line,
+                       'Relationships': [{'Type': 'CHILD', 'Ids': word_ids}]})
+        blocks += [{'BlockType': 'WORD', 'Id': w, 'Text': t} for w, t in zip(word_ids, line.split())]
+        if key:
+            n = len(key.split())
+            blocks.append({'BlockType': 'KEY_VALUE_SET', 'Id': f'key-{i}', 'EntityTypes': ['KEY'],
+                           'Relationships': [{'Type': 'VALUE', 'Ids': [f'value-{i}']},
+                                             {'Type': 'CHILD', 'Ids': word_ids[:n]}]})
+            blocks.append({'BlockType': 'KEY_VALUE_SET', 'Id': f'value-{i}', 'EntityTypes': ['VALUE'],
+                           'Relationships': [{'Type': 'CHILD', 'Ids': word_ids[n:]}]})
+    return {'Blocks': blocks}
+
+
+class FakeAWSClient:
+    """
+    Cliente local com as operações usadas pelas ferramentas. Cada chamada espera
+    latency_ms (± jitter) e falha com ThrottlingException na proporção error_rate.
+    Na proporção slow_rate, a chamada demora slow_ms (outliers de cauda).
+    Jobs assíncronos do Textract ficam IN_PROGRESS por async_polls consultas, terminam
+    em async_final_status e devolvem `pages` páginas paginadas por MaxResults/NextToken.
+    """
+
+    class exceptions:
+        class InvalidParameterException(Exception):
+            pass
+
+    def __init__(self, service: str, latency_ms: float = 0.0, jitter: float = 0.2,
+                 error_rate: float = 0.0, textract_lines: int = 60, seed: Optional[int] = None,
+                 slow_rate: float = 0.0, slow_ms: float = 0.0, pages: int = 2,
+                 async_polls: int = 2, async_final_status: str = 'SUCCEEDED'):
+        self.service = service
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow_ms = slow_ms
+        self.textract_response = textract_blocks(textract_lines)
+        self.pages = pages
+        self.async_polls = async_polls
+        self.async_final_status = async_final_status
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self.calls: Dict[str, int] = {}
+        self.objects: Dict[str, bytes] = {}
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _call(self, operation: str) -> None:
+        with self._lock:
+            self.calls[operation] = self.calls.get(operation, 0) + 1
+            delay = self.latency_ms * (1 + self._random.uniform(-self.jitter, self.jitter))
+            fail = self._random.random() < self.error_rate
+            if self._random.random() < self.slow_rate:
+                delay = self.slow_ms
+        if delay > 0:
+            time.sleep(delay / 1000)
+        if fail:
+            raise ClientError(
+                {'Error': {'Code': 'ThrottlingException', 'Message': 'Rate exceeded'}},
+                operation
+            )
+
+    # S3
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self._call('PutObject')
+        self.objects[f'{Bucket}/{Key}'] = bytes(Body)
+        return {'ETag': '"local"'}
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, ExtraArgs=None, Callback=None, Config=None):
+        """Como o TransferManager: PUT único abaixo do limite, senão multipart em partes de chunksize"""
+        threshold = Config.multipart_threshold if Config else 8 * 1024 * 1024
+        chunksize = Config.multipart_chunksize if Config else 8 * 1024 * 1024
+        parts = []
+        while True:
+            part = Fileobj.read(chunksize)
+            if not part:
+                break
+            parts.append(part)
+        body = b''.join(parts)
+        if len(body) < threshold:
+            self._call('PutObject')
+        else:
+            self._call('CreateMultipartUpload')
+            for _ in parts:
+                self._call('UploadPart')
+            self._call('CompleteMultipartUpload')
+        self.objects[f'{Bucket}/{Key}'] = body
+
+    def head_object(self, Bucket, Key, **kwargs):
+        self._call('HeadObject')
+        if f'{Bucket}/{Key}' not in self.objects:
+            raise ClientError({'Error': {'Code': '404', 'Message': 'Not Found'}}, 'HeadObject')
+        return {'ETag': '"local"'}
+
+    def get_object(self, Bucket, Key, **kwargs):
+        self._call('GetObject')
+        if f'{Bucket}/{Key}' not in self.objects:
+            raise ClientError({'Error': {'Code': 'NoSuchKey', 'Message': 'Not Found'}}, 'GetObject')
+        return {'Body': _Body(self.objects[f'{Bucket}/{Key}'])}
+
+    # Textract
+    def analyze_document(self, Document, FeatureTypes, **kwargs):
+        self._call('AnalyzeDocument')
+        return {'Blocks': list(self.textract_response['Blocks'])}
+
+    def detect_document_text(self, Document, **kwargs):
+        self._call('DetectDocumentText')
+        return {'Blocks': [b for b in self.textract_response['Blocks'] if b['BlockType'] in ('LINE', 'WORD')]}
+
+    def start_document_analysis(self, DocumentLocation, FeatureTypes, ClientRequestToken=None, **kwargs):
+        self._call('StartDocumentAnalysis')
+        with self._lock:
+            # Mesmo token, mesmo job (idempotência da API real)
+            for job_id, job in self.jobs.items():
+                if ClientRequestToken and job['token'] == ClientRequestToken:
+                    return {'JobId': job_id}
+            job_id = uuid.uuid4().hex
+            self.jobs[job_id] = {'token': ClientRequestToken, 'polls': self.async_polls}
+        return {'JobId': job_id}
+
+    def get_document_analysis(self, JobId, MaxResults=1000, NextToken=None, **kwargs):
+        self._call('GetDocumentAnalysis')
+        job = self.jobs.get(JobId)
+        if job is None:
+            raise ClientError({'Error': {'Code': 'InvalidJobIdException', 'Message': 'Invalid job'}},
+                              'GetDocumentAnalysis')
+        with self._lock:
+            if job['polls'] > 0:
+                job['polls'] -= 1
+                return {'JobStatus': 'IN_PROGRESS'}
+        if self.async_final_status == 'FAILED':
+            return {'JobStatus': 'FAILED', 'StatusMessage': 'Documento inválido'}
+
+        # Blocos de cada página gerados sob demanda a partir do offset do NextToken
+        per_page = len(self.textract_response['Blocks'])
+        start = int(NextToken or 0)
+        end = min(start + MaxResults, per_page * self.pages)
+        blocks = []
+        for i in range(start, end):
+            page, block = divmod(i, per_page)
+            blocks.append(self._page_block(self.textract_response['Blocks'][block], page + 1))
+        response = {
+            'JobStatus': self.async_final_status,
+            'DocumentMetadata': {'Pages': self.pages},
+            'Blocks': blocks
+        }
+        if end < per_page * self.pages:
+            response['NextToken'] = str(end)
+        return response
+
+    @staticmethod
+    def _page_block(block: Dict[str, Any], page: int) -> Dict[str, Any]:
+        """Cópia do bloco com Ids únicos por página"""
+        copy = dict(block, Id=f"p{page}-{block['Id']}", Page=page)
+        if 'Relationships' in block:
+            copy['Relationships'] = [
+                dict(rel, Ids=[f'p{page}-{i}' for i in rel['Ids']]) for rel in block['Relationships']
+            ]
+        return copy
+
+    # Rekognition
+    def compare_faces(self, SourceImage, TargetImage, **kwargs):
+        self._call('CompareFaces')
+        return {'FaceMatches': [{'Similarity': 80 + self._random.random() * 20}]}
+
+    def detect_faces(self, Image, **kwargs):
+        self._call('DetectFaces')
+        return {'FaceDetails': [{'BoundingBox': {'Left': 0.1, 'Top': 0.2, 'Width': 0.25, 'Height': 0.35}}]}
+
+
+class _Body:
+    def __init__(self, data: bytes):
+        self._data = data
+
+    def read(self) -> bytes:
+        return self._data
+
+
+def install_fake_clients(latency_ms: float = 0.0, error_rate: float = 0.0,
+                         textract_lines: int = 60, seed: Optional[int] = None,
+                         slow_rate: float = 0.0, slow_ms: float = 0.0, **options) -> Dict[str, FakeAWSClient]:
+    """
+    Registra clientes locais para s3, textract e rekognition no registro compartilhado
+    (options: demais parâmetros do FakeAWSClient, ex.: pages, async_polls)
+    """
+    clients = {}
+    for service in ('s3', 'textract', 'rekognition'):
+        clients[service] = FakeAWSClient(service, latency_ms=latency_ms, error_rate=error_rate,
+                                         textract_lines=textract_lines, seed=seed,
+                                         slow_rate=slow_rate, slow_ms=slow_ms, **options)
+        aws_clients.set_client(service, clients[service])
+    return clients
+
+
+class FakeAgentRuntime:
+    """
+    Substituto do bedrock-agent-runtime que segue o roteiro de validação: com uma
+    referência de documento pede extract_text_from_document, com a selfie pede
+    compare_faces, e responde em vários chunks de texto. latency_ms simula o modelo.
+    """
+
+    REFERENCE = re.compile(r'\[(documento|selfie): s3://([^/\]]+)/([^\]]+)\]')
+
+    def __init__(self, latency_ms: float = 0.0, chunk_size: int = 16):
+        self.latency_ms = latency_ms
+        self.chunk_size = chunk_size
+        self.calls = 0
+        self.tool_calls: Dict[str, int] = {}
+
+        self._documents: Dict[str, Dict[str, str]] = {}
+        self._lock = threading.Lock()
+
+    def invoke_agent(self, agentId, agentAliasId, sessionId, inputText=None, sessionState=None, **kwargs):
+        with self._lock:
+            self.calls += 1
+        if self.latency_ms > 0:
+            time.sleep(self.latency_ms / 1000)
+
+        if sessionState and 'returnControlInvocationResults' in sessionState:
+            results = sessionState['returnControlInvocationResults']
+            function = results[0]['functionResult']['function']
+            text = f'Resultado de {function} recebido. ' + ('Agora envie uma selfie.'
+                   if function == 'extract_text_from_document' else 'Validação concluída.')
+            return {'completion': self._chunks(text)}
+
+        match = self.REFERENCE.search(inputText or '')
+        if not match:
+            return {'completion': self._chunks('Olá! Envie a foto do seu documento de identidade.')}
+
+        kind, bucket, key = match.groups()
+        if kind == 'documento':
+            self._documents[sessionId] = {'bucket': bucket, 'key': key}
+            return {'completion': [self._return_control('extract_text_from_document', bucket=bucket, key=key)]}
+
+        document = self._documents.get(sessionId, {'bucket': bucket, 'key': key})
+        return {'completion': [self._return_control(
+            'compare_faces', source_bucket=document['bucket'], source_key=document['key'],
+            target_bucket=bucket, target_key=key)]}
+
+    def _chunks(self, text: str):
+        data = text.encode('utf-8')
+        return [{'chunk': {'bytes': data[i:i + self.chunk_size]}} for i in range(0, len(data), self.chunk_size)]
+
+    def _return_control(self, function: str, **params) -> Dict[str, Any]:
+        with self._lock:
+            self.tool_calls[function] = self.tool_calls.get(function, 0) + 1
+        return {'returnControl': {
+            'invocationId': str(uuid.uuid4()),
+            'invocationInputs': [{'functionInvocationInput': {
+                'actionGroup': function,
+                'function': function,
+                'parameters': [{'name': k, 'type': 'string', 'value': v} for k, v in params.items()]
+            }}]
+        }}
+
+
+class FakeBedrockAgentClient:
+    """
+    Substituto do bedrock-agent para o provisionamento: agentes, action groups e aliases
+    em memória, com os estados assíncronos (CREATING, PREPARING, ...) durando
+    `transitions` consultas e latência de latency_ms por chamada.
+    """
+
+    def __init__(self, latency_ms: float = 0.0, transitions: int = 2):
+        self.latency_ms = latency_ms
+        self.transitions = transitions
+        self.calls: Dict[str, int] = {}
+        self.agents: Dict[str, Dict[str, Any]] = {}
+        self.action_groups: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self.aliases: Dict[str, Dict[str, Dict[str, Any]]] = {}
+
+        self._pending: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def _call(self, operation: str) -> None:
+        with self._lock:
+            self.calls[operation] = self.calls.get(operation, 0) + 1
+        if self.latency_ms > 0:
+            time.sleep(self.latency_ms / 1000)
+
+    def _transition(self, key: tuple, target: Dict[str, Any], field: str, steps: list) -> None:
+        """Estados intermediários seguidos do final, avançando a cada consulta"""
+        target[field] = steps[0]
+        self._pending[key] = [target, field, steps[1:]]
+
+    def _advance(self, key: tuple) -> None:
+        pending = self._pending.get(key)
+        if pending:
+            target, field, steps = pending
+            target[field] = steps.pop(0)
+            if not steps:
+                del self._pending[key]
+
+    def _not_found(self, operation: str):
+        return ClientError({'Error': {'Code': 'ResourceNotFoundException', 'Message': 'Not found'}}, operation)
+
+    def get_paginator(self, operation: str):
+        client = self
+
+        class _Paginator:
+            def paginate(self, **params):
+                return [getattr(client, operation)(**params)]
+
+        return _Paginator()
+
+    # Agente
+    def list_agents(self, **kwargs):
+        self._call('ListAgents')
+        return {'agentSummaries': [{'agentId': a['agentId'], 'agentName': a['agentName']}
+                                   for a in self.agents.values()]}
+
+    def create_agent(self, **definition):
+        self._call('CreateAgent')
+        agent_id = uuid.uuid4().hex[:10].upper()
+        agent = dict(definition, agentId=agent_id)
+        self.agents[agent_id] = agent
+        self.action_groups[agent_id] = {}
+        self.aliases[agent_id] = {}
+        self._transition(('agent', agent_id), agent, 'agentStatus', ['CREATING'] * self.transitions + ['NOT_PREPARED'])
+        return {'agent': dict(agent)}
+
+    def get_agent(self, agentId):
+        self._call('GetAgent')
+        if agentId not in self.agents:
+            raise self._not_found('GetAgent')
+        self._advance(('agent', agentId))
+        return {'agent': dict(self.agents[agentId])}
+
+    def update_agent(self, agentId, **definition):
+        self._call('UpdateAgent')
+        self.agents[agentId].update(definition)
+        self._transition(('agent', agentId), self.agents[agentId], 'agentStatus',
+                         ['UPDATING'] * self.transitions + ['NOT_PREPARED'])
+        return {'agent': dict(self.agents[agentId])}
+
+    def prepare_agent(self, agentId):
+        self._call('PrepareAgent')
+        self._transition(('agent', agentId), self.agents[agentId], 'agentStatus',
+                         ['PREPARING'] * self.transitions + ['PREPARED'])
+        return {'agentId': agentId, 'agentStatus': 'PREPARING'}
+
+    # Action groups
+    def list_agent_action_groups(self, agentId, agentVersion, **kwargs):
+        self._call('ListAgentActionGroups')
+        return {'actionGroupSummaries': [
+            {'actionGroupId': g['actionGroupId'], 'actionGroupName': g['actionGroupName']}
+            for g in self.action_groups[agentId].values()
+        ]}
+
+    def create_agent_action_group(self, agentId, agentVersion, **definition):
+        self._call('CreateAgentActionGroup')
+        group_id = uuid.uuid4().hex[:10].upper()
+        with self._lock:
+            self.action_groups[agentId][group_id] = dict(definition, actionGroupId=group_id)
+        self.agents[agentId]['agentStatus'] = 'NOT_PREPARED'
+        return {'agentActionGroup': dict(self.action_groups[agentId][group_id])}
+
+    def get_agent_action_group(self, agentId, agentVersion, actionGroupId):
+        self._call('GetAgentActionGroup')
+        return {'agentActionGroup': dict(self.action_groups[agentId][actionGroupId])}
+
+    def update_agent_action_group(self, agentId, agentVersion, actionGroupId, **definition):
+        self._call('UpdateAgentActionGroup')
+        with self._lock:
+            self.action_groups[agentId][actionGroupId].update(definition)
+        self.agents[agentId]['agentStatus'] = 'NOT_PREPARED'
+        return {'agentActionGroup': dict(self.action_groups[agentId][actionGroupId])}
+
+    # Aliases
+    def list_agent_aliases(self, agentId, **kwargs):
+        self._call('ListAgentAliases')
+        return {'agentAliasSummaries': [
+            {'agentAliasId': a['agentAliasId'], 'agentAliasName': a['agentAliasName']}
+            for a in self.aliases.get(agentId, {}).values()
+        ]}
+
+    def create_agent_alias(self, agentId, agentAliasName, **kwargs):
+        self._call('CreateAgentAlias')
+        alias_id = uuid.uuid4().hex[:10].upper()
+        alias = {'agentAliasId': alias_id, 'agentAliasName': agentAliasName}
+        self.aliases[agentId][alias_id] = alias
+        self._transition(('alias', alias_id), alias, 'agentAliasStatus', ['CREATING'] * self.transitions + ['PREPARED'])
+        return {'agentAlias': dict(alias)}
+
+    def update_agent_alias(self, agentId, agentAliasId, agentAliasName, **kwargs):
+        self._call('UpdateAgentAlias')
+        alias = self.aliases[agentId][agentAliasId]
+        self._transition(('alias', agentAliasId), alias, 'agentAliasStatus', ['UPDATING'] * self.transitions + ['PREPARED'])
+        return {'agentAlias': dict(alias)}
+
+    def get_agent_alias(self, agentId, agentAliasId):
+        self._call('GetAgentAlias')
+        alias = self.aliases.get(agentId, {}).get(agentAliasId)
+        if alias is None:
+            raise self._not_found('GetAgentAlias')
+        self._advance(('alias', agentAliasId))
+        return {'agentAlias': dict(alias)}
@@ -1,49 +1,108 @@
-import boto3
+import base64
+import codecs
 import json
+import mimetypes
+import re
 import sys
 import os
-from typing import Dict, Any
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Iterator, List, Optional
 
 # Adicionar diretório tools ao path
 sys.path.append('tools')
 
-from ferramenta1 import lambda_handler as upload_handler
-from ferramenta2 import lambda_handler as textract_handler
-from ferramenta3 import lambda_handler as rekognition_handler
+import image_store
+import metrics
+import tool_registry
+from agent_provisioning import provision_agent
+from aws_clients import get_client
+# Importar as ferramentas as registra no tool_registry
+from ferramenta1 import store_image
+from image_preprocessing import DOCUMENT_EXTENSIONS, ImageQualityError
+from orchestrator import ValidationOrchestrator
+import ferramenta2
+import ferramenta3
+
+# Agente provisionado (encontrado pelo nome ou criado)
+AGENT_NAME = os.environ.get('BEDROCK_AGENT_NAME', 'DocumentValidationAgent')
+AGENT_ALIAS_NAME = os.environ.get('BEDROCK_AGENT_ALIAS_NAME', 'DRAFT')
+AGENT_ROLE_ARN = os.environ.get('BEDROCK_AGENT_ROLE_ARN', 'arn:aws:iam::369409857483:role/BedrockDocumentValidationRole')
+FOUNDATION_MODEL = os.environ.get('BEDROCK_FOUNDATION_MODEL', 'anthropic.claude-3-5-sonnet-20241022-v2:0')
+# Com o ARN da Lambda unificada (lambda_function.py), as ferramentas rodam nela em vez de RETURN_CONTROL
+TOOLS_LAMBDA_ARN = os.environ.get('BEDROCK_TOOLS_LAMBDA_ARN')
+
+TOOL_WORKERS = int(os.environ.get('AGENT_TOOL_WORKERS', '4'))
+MAX_TOOL_ROUNDS = int(os.environ.get('AGENT_MAX_TOOL_ROUNDS', '10'))
+
+# 'agent': cada turno passa pelo invoke_agent; 'orchestrator': fluxo fixo executado
+# localmente (orchestrator.py), sem o agente Bedrock
+AGENT_MODE = os.environ.get('AGENT_MODE', 'agent')
+
+# Pedir ao Bedrock a resposta final em partes, em vez de um único chunk
+STREAMING_CONFIGURATIONS = {
+    'streamFinalResponse': os.environ.get('AGENT_STREAM_FINAL_RESPONSE', '1') == '1'
+}
+
+# Imagens (e documentos PDF/TIFF) enviados na mensagem: data URLs ou caminhos de arquivo locais
+# (o caminho é um token inteiro, para não varrer o base64 com backtracking quadrático)
+DATA_URL_PATTERN = re.compile(r'data:(image/[\w.+-]+|application/pdf);base64,([A-Za-z0-9+/]+={0,2})')
+IMAGE_PATH_PATTERN = re.compile(r'(?<!\S)\S+?\.(?:jpe?g|png|pdf|tiff?)(?![^\s,;)])', re.IGNORECASE)
+
+class ValidationSession:
+    """Estado de uma conversa de validação"""
+    def __init__(self, session_id: Optional[str] = None):
+        self.session_id = session_id or str(uuid.uuid4())
+        self.document_s3_info = None
+        # Imagem JPG/PNG do documento usada em compare_faces: o próprio documento ou,
+        # quando ele é PDF/TIFF, a primeira página renderizada ou uma foto enviada depois
+        self.face_reference_s3_info = None
+        self.selfie_s3_info = None
+        self.last_used = time.time()
+        # Usados apenas no modo orquestrador
+        self.state = 'awaiting_document'
+        self.extraction = None
+        self.compared_selfie = None
 
 class DocumentValidationAgent:
-    def __init__(self):
-        self.bedrock_agent_client = boto3.client('bedrock-agent')
-        self.bedrock_runtime = boto3.client('bedrock-agent-runtime')
+    def __init__(self, mode: str = AGENT_MODE):
+        if mode not in ('agent', 'orchestrator'):
+            raise ValueError(f'Modo inválido: {mode}')
+        self.mode = mode
+        self.orchestrator = ValidationOrchestrator(self)
+        
+        self.bedrock_agent_client = get_client('bedrock-agent')
+        self.bedrock_runtime = get_client('bedrock-agent-runtime')
         
         # Configurações do agente
         self.agent_id = None
         self.agent_alias_id = None
-        self.session_id = "document-validation-session"
         
-        # Estado da conversação
-        self.document_s3_info = None
-        self.selfie_s3_info = None
+        # Estado da conversação (sessão padrão do modo interativo)
+        self.session = ValidationSession("document-validation-session")
         
-    def create_agent(self):
-        """Criar agente Bedrock"""
-        try:
-            # Instruções do agente
-            instructions = """
+        # Pool para executar em paralelo as ferramentas de um mesmo returnControl
+        self.tool_executor = ThreadPoolExecutor(max_workers=TOOL_WORKERS, thread_name_prefix='tool')
+        
+    def agent_definition(self) -> Dict[str, Any]:
+        """Definição completa do agente (usada também na impressão digital do cache)"""
+        # Instruções do agente
+        instructions = """
             Você é um assistente especializado em validação de documentos com foto.
             
             SEU FLUXO DE TRABALHO:
             
             FASE 1 - DOCUMENTO:
             1. Solicite ao usuário que envie a foto de um documento de identidade (RG, CNH, etc.)
-            2. Quando receber a imagem em base64, use a ferramenta upload_to_s3
-            3. Em seguida, use a ferramenta extract_text_from_document para extrair os dados
+            2. A imagem chega já armazenada, como uma referência s3://bucket/key na mensagem
+            3. Use a ferramenta extract_text_from_document com o bucket e a key dessa referência
             4. Apresente os dados extraídos (CPF, nome, data de nascimento) ao usuário
             
             FASE 2 - SELFIE E VALIDAÇÃO:
             5. Após extrair os dados do documento, solicite uma selfie do usuário
-            6. Quando receber a selfie em base64, use a ferramenta upload_to_s3
-            7. Use a ferramenta compare_faces para comparar a face do documento com a selfie
+            6. A selfie também chega como uma referência s3://bucket/key
+            7. Use a ferramenta compare_faces com a referência do documento (source) e da selfie (target)
             8. Informe se a validação foi bem-sucedida (similaridade >= 80%)
             
             INSTRUÇÕES IMPORTANTES:
@@ -51,232 +110,256 @@ class DocumentValidationAgent:
             - Explique cada etapa do processo
             - Em caso de erro, explique o problema e oriente o usuário
             - Mantenha o foco no fluxo sequencial: documento → dados → selfie → validação
+            - Use upload_to_s3 apenas se receber uma imagem em base64 em vez de uma referência s3://
+            - Use get_face_details para verificar se há uma face visível quando compare_faces não encontrar faces
+            - Se a mensagem trouxer [imagem rejeitada: motivo], explique o motivo e peça uma nova foto
+            - Documento em PDF/TIFF: extraia os dados dele, mas use a [foto do documento] como source
+              em compare_faces; se não houver foto do documento, peça uma foto (JPG/PNG) do documento
+              antes da selfie
             """
-            
-            # Criar agente
-            response = self.bedrock_agent_client.create_agent(
-                agentName='DocumentValidationAgent',
-                agentResourceRoleArn='arn:aws:iam::369409857483:role/BedrockDocumentValidationRole',
-                description='Agente para validação de documentos com foto',
-                foundationModel='anthropic.claude-3-5-sonnet-20241022-v2:0',
-                instruction=instructions,
-                idleSessionTTLInSeconds=3600
-            )
-            
-            self.agent_id = response['agent']['agentId']
-            print(f"Agente criado com ID: {self.agent_id}")
-            
-            # Criar action groups
-            self._create_action_groups()
-            
-            # Preparar agente
-            self.bedrock_agent_client.prepare_agent(agentId=self.agent_id)
-            
-            # Criar alias
-            alias_response = self.bedrock_agent_client.create_agent_alias(
-                agentId=self.agent_id,
-                agentAliasName='DRAFT'
-            )
-            
-            self.agent_alias_id = alias_response['agentAlias']['agentAliasId']
-            print(f"Alias criado: {self.agent_alias_id}")
+        
+        return {
+            'agent': {
+                'agentName': AGENT_NAME,
+                'agentResourceRoleArn': AGENT_ROLE_ARN,
+                'description': 'Agente para validação de documentos com foto',
+                'foundationModel': FOUNDATION_MODEL,
+                'instruction': instructions,
+                'idleSessionTTLInSeconds': 3600
+            },
+            'action_groups': self._action_group_definitions(),
+            'alias_name': AGENT_ALIAS_NAME
+        }
+    
+    def create_agent(self):
+        """
+        Criar (ou reutilizar) o agente Bedrock: agente, action groups e alias existentes
+        são encontrados pelo nome ou pelo cache local e só são alterados se mudaram
+        """
+        try:
+            self.agent_id, self.agent_alias_id = provision_agent(self.bedrock_agent_client, self.agent_definition())
+            print(f"Agente pronto: {self.agent_id} (alias {self.agent_alias_id})")
             
         except Exception as e:
             print(f"Erro ao criar agente: {e}")
             
-    def _create_action_groups(self):
-        """Criar action groups para as ferramentas"""
+    def _action_group_definitions(self) -> List[Dict[str, Any]]:
+        """Action groups gerados a partir do registro de ferramentas"""
+        executor = {'lambda': TOOLS_LAMBDA_ARN} if TOOLS_LAMBDA_ARN else None
+        return tool_registry.action_groups(executor)
         
-        # Action Group 1 - Upload S3
-        upload_schema = {
-            "type": "object",
-            "properties": {
-                "image_data": {
-                    "type": "string",
-                    "description": "Imagem codificada em base64"
-                }
-            },
-            "required": ["image_data"]
-        }
+    def _execute_action(self, action_group: str, function: str, parameters: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Executar ação localmente (roteamento pelo registro de ferramentas)"""
+        return tool_registry.dispatch({
+            'actionGroup': action_group,
+            'function': function,
+            'parameters': parameters
+        })
+    
+    def _ingest_images(self, user_input: str, session: ValidationSession,
+                       rejections: Optional[List[str]] = None, allow_local_paths: bool = False) -> str:
+        """
+        Faz upload local das imagens da mensagem e as substitui por referências s3://;
+        os motivos das imagens reprovadas são acrescentados a `rejections`.
+        Caminhos de arquivo só são lidos com allow_local_paths (CLI interativa): mensagens
+        remotas (servidor HTTP, runtime assíncrono) não podem apontar arquivos do servidor.
+        """
         
-        self.bedrock_agent_client.create_agent_action_group(
-            agentId=self.agent_id,
-            agentVersion='DRAFT',
-            actionGroupName='upload_to_s3',
-            description='Ferramenta para upload de imagens para S3',
-            actionGroupExecutor={
-                'customControl': 'RETURN_CONTROL'
-            },
-            functionSchema={
-                'functions': [
-                    {
-                        'name': 'upload_to_s3',
-                        'description': 'Faz upload de uma imagem em base64 para o S3',
-                        'parameters': upload_schema
-                    }
-                ]
-            }
-        )
+        def register(stored: Dict[str, Any]) -> str:
+            # Primeira imagem é o documento; se ele for PDF/TIFF sem página renderizada,
+            # a seguinte é a foto do documento; depois, a selfie
+            info = {'bucket': stored['bucket'], 'key': stored['key']}
+            if session.document_s3_info is None:
+                session.document_s3_info = info
+                label = f"[documento: {stored['s3_uri']}]"
+                if not stored['key'].lower().endswith(DOCUMENT_EXTENSIONS):
+                    session.face_reference_s3_info = info
+                elif 'face_reference' in stored:
+                    reference = stored['face_reference']
+                    session.face_reference_s3_info = {'bucket': reference['bucket'], 'key': reference['key']}
+                    label += f" [foto do documento: {reference['s3_uri']}]"
+                return label
+            if session.face_reference_s3_info is None:
+                session.face_reference_s3_info = info
+                return f"[foto do documento: {stored['s3_uri']}]"
+            session.selfie_s3_info = info
+            return f"[selfie: {stored['s3_uri']}]"
         
-        # Action Group 2 - Textract
-        textract_schema = {
-            "type": "object",
-            "properties": {
-                "bucket": {
-                    "type": "string",
-                    "description": "Nome do bucket S3"
-                },
-                "key": {
-                    "type": "string", 
-                    "description": "Chave do objeto no S3"
-                }
-            },
-            "required": ["bucket", "key"]
-        }
+        def store(image_bytes: bytes, content_type: str) -> str:
+            # Imagens reprovadas no controle de qualidade não são enviadas; o agente
+            # recebe o motivo para orientar o usuário
+            try:
+                return register(store_image(image_bytes, content_type))
+            except ImageQualityError as e:
+                if rejections is not None:
+                    rejections.append(str(e))
+                return f"[imagem rejeitada: {e}]"
         
-        self.bedrock_agent_client.create_agent_action_group(
-            agentId=self.agent_id,
-            agentVersion='DRAFT',
-            actionGroupName='extract_text_from_document',
-            description='Ferramenta para extrair texto de documentos usando Textract',
-            actionGroupExecutor={
-                'customControl': 'RETURN_CONTROL'
-            },
-            functionSchema={
-                'functions': [
-                    {
-                        'name': 'extract_text_from_document',
-                        'description': 'Extrai texto e dados específicos de um documento',
-                        'parameters': textract_schema
-                    }
-                ]
-            }
-        )
+        def replace_data_url(match) -> str:
+            return store(base64.b64decode(match.group(2)), match.group(1))
         
-        # Action Group 3 - Rekognition
-        rekognition_schema = {
-            "type": "object",
-            "properties": {
-                "source_bucket": {
-                    "type": "string",
-                    "description": "Bucket da imagem fonte (documento)"
-                },
-                "source_key": {
-                    "type": "string",
-                    "description": "Chave da imagem fonte no S3"
-                },
-                "target_bucket": {
-                    "type": "string",
-                    "description": "Bucket da imagem alvo (selfie)"
-                },
-                "target_key": {
-                    "type": "string",
-                    "description": "Chave da imagem alvo no S3"
-                }
-            },
-            "required": ["source_bucket", "source_key", "target_bucket", "target_key"]
-        }
+        def replace_path(match) -> str:
+            path = os.path.expanduser(match.group(0))
+            if not os.path.isfile(path):
+                return match.group(0)
+            content_type = mimetypes.guess_type(path)[0] or 'image/jpeg'
+            with open(path, 'rb') as f:
+                return store(f.read(), content_type)
         
-        self.bedrock_agent_client.create_agent_action_group(
-            agentId=self.agent_id,
-            agentVersion='DRAFT',
-            actionGroupName='compare_faces',
-            description='Ferramenta para comparar faces usando Rekognition',
-            actionGroupExecutor={
-                'customControl': 'RETURN_CONTROL'
-            },
-            functionSchema={
-                'functions': [
-                    {
-                        'name': 'compare_faces',
-                        'description': 'Compara faces entre duas imagens',
-                        'parameters': rekognition_schema
+        text = DATA_URL_PATTERN.sub(replace_data_url, user_input)
+        if not allow_local_paths:
+            return text
+        return IMAGE_PATH_PATTERN.sub(replace_path, text)
+    
+    def _run_invocations(self, control_event: Dict[str, Any],
+                         session: Optional[ValidationSession] = None) -> List[Dict[str, Any]]:
+        """Executa em paralelo as ferramentas de um evento returnControl, preservando a ordem"""
+        
+        def run(func_input: Dict[str, Any]) -> Dict[str, Any]:
+            action_group = func_input['actionGroup']
+            function = func_input['function']
+            parameters = func_input.get('parameters', [])
+            
+            # Executar função localmente
+            action_result = self._execute_action(action_group, function, parameters)
+            if session is not None and function == 'extract_text_from_document':
+                self._reset_document_on_failure(session, action_result['response'])
+            
+            return {
+                'functionResult': {
+                    'actionGroup': action_group,
+                    'function': function,
+                    'responseBody': {
+                        'TEXT': {
+                            'body': json.dumps(action_result['response'])
+                        }
                     }
-                ]
+                }
             }
-        )
         
-    def _execute_action(self, action_group: str, function: str, parameters: Dict[str, Any]) -> Dict[str, Any]:
-        """Executar ação localmente"""
+        func_inputs = [
+            input_item['functionInvocationInput']
+            for input_item in control_event.get('invocationInputs', [])
+            if 'functionInvocationInput' in input_item
+        ]
         
-        # Criar evento no formato esperado pelas ferramentas
-        event = {
-            'actionGroup': action_group,
-            'function': function,
-            'parameters': [{'name': k, 'value': v} for k, v in parameters.items()]
-        }
-        
-        # Roteamento para handlers apropriados
-        if action_group == 'upload_to_s3':
-            return upload_handler(event, None)
-        elif action_group == 'extract_text_from_document':
-            return textract_handler(event, None)
-        elif action_group == 'compare_faces':
-            return rekognition_handler(event, None)
-        else:
-            return {'response': {'error': 'Action group não encontrado'}}
+        if len(func_inputs) == 1:
+            return [run(func_inputs[0])]
+        return list(self.tool_executor.map(run, func_inputs))
     
-    def chat(self, user_input: str) -> str:
-        """Interface de chat com o agente"""
-        try:
-            # Invocar agente
-            response = self.bedrock_runtime.invoke_agent(
-                agentId=self.agent_id,
-                agentAliasId=self.agent_alias_id,
-                sessionId=self.session_id,
-                inputText=user_input
-            )
-            
-            # Processar resposta
-            result = ""
-            event_stream = response['completion']
+    @staticmethod
+    def _reset_document_on_failure(session: ValidationSession, result: Dict[str, Any]) -> None:
+        """
+        Extração com erro: o agente vai pedir outro documento, então a próxima imagem
+        deve chegar rotulada como documento, não como selfie. Extração parcial (campo
+        faltando ou CPF inválido) segue para a selfie, como no modo orquestrador.
+        """
+        if 'error' in result:
+            session.document_s3_info = None
+            session.face_reference_s3_info = None
+            session.selfie_s3_info = None
+    
+    def _stream_events(self, event_stream, session: ValidationSession) -> Iterator[Dict[str, Any]]:
+        """
+        Lê o stream de resposta do agente, emitindo texto à medida que chega. A cada
+        returnControl, executa as ferramentas, devolve todos os resultados em uma única
+        chamada e continua lendo o novo stream.
+        """
+        # Decodificador incremental: caracteres multibyte podem vir divididos entre chunks
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        rounds = 0
+        
+        while event_stream is not None:
+            next_stream = None
             
             for event in event_stream:
                 if 'chunk' in event:
                     chunk = event['chunk']
                     if 'bytes' in chunk:
-                        result += chunk['bytes'].decode('utf-8')
+                        text = decoder.decode(chunk['bytes'])
+                        if text:
+                            yield {'type': 'text', 'text': text}
                 elif 'returnControl' in event:
-                    # Executar ação solicitada
+                    rounds += 1
+                    if rounds > MAX_TOOL_ROUNDS:
+                        raise RuntimeError(f'Limite de {MAX_TOOL_ROUNDS} rodadas de ferramentas excedido')
+                    
+                    # Executar ações solicitadas
                     control_event = event['returnControl']
-                    invocation_id = control_event['invocationId']
+                    tools = [
+                        input_item['functionInvocationInput']['function']
+                        for input_item in control_event.get('invocationInputs', [])
+                        if 'functionInvocationInput' in input_item
+                    ]
+                    yield {'type': 'tool_start', 'tools': tools}
+                    invocation_results = self._run_invocations(control_event, session)
+                    yield {'type': 'tool_end', 'tools': tools}
                     
-                    if 'invocationInputs' in control_event:
-                        for input_item in control_event['invocationInputs']:
-                            if 'functionInvocationInput' in input_item:
-                                func_input = input_item['functionInvocationInput']
-                                action_group = func_input['actionGroup']
-                                function = func_input['function']
-                                parameters = {p['name']: p['value'] for p in func_input.get('parameters', [])}
-                                
-                                # Executar função localmente
-                                action_result = self._execute_action(action_group, function, parameters)
-                                
-                                # Retornar resultado para o agente
-                                self.bedrock_runtime.invoke_agent(
-                                    agentId=self.agent_id,
-                                    agentAliasId=self.agent_alias_id,
-                                    sessionId=self.session_id,
-                                    inputText="",
-                                    returnControlInvocationResults=[
-                                        {
-                                            'functionResult': {
-                                                'actionGroup': action_group,
-                                                'function': function,
-                                                'responseBody': {
-                                                    'TEXT': {
-                                                        'body': json.dumps(action_result['response'])
-                                                    }
-                                                }
-                                            }
-                                        }
-                                    ]
-                                )
+                    # Retornar resultados para o agente em lote
+                    with metrics.span('bedrock.invoke_agent'):
+                        response = self.bedrock_runtime.invoke_agent(
+                            agentId=self.agent_id,
+                            agentAliasId=self.agent_alias_id,
+                            sessionId=session.session_id,
+                            sessionState={
+                                'invocationId': control_event['invocationId'],
+                                'returnControlInvocationResults': invocation_results
+                            },
+                            streamingConfigurations=STREAMING_CONFIGURATIONS
+                        )
+                    next_stream = response['completion']
             
-            return result
+            event_stream = next_stream
+        
+        text = decoder.decode(b'', final=True)
+        if text:
+            yield {'type': 'text', 'text': text}
+    
+    def chat_stream(self, user_input: str, session: Optional[ValidationSession] = None,
+                    allow_local_paths: bool = False) -> Iterator[Dict[str, Any]]:
+        """
+        Interface de chat em streaming: gera eventos {'type': 'text'}, {'type': 'tool_start'},
+        {'type': 'tool_end'} e, em caso de falha, {'type': 'error'}. No modo orquestrador
+        também gera {'type': 'validation'} com o resultado da comparação.
+        allow_local_paths: ler imagens de caminhos locais citados na mensagem (somente CLI).
+        """
+        session = session or self.session
+        session.last_used = time.time()
+        try:
+            if self.mode == 'orchestrator':
+                with metrics.span('orchestrator.turn'):
+                    yield from self.orchestrator.run(user_input, session, allow_local_paths)
+                return
+            
+            # Enviar ao agente apenas referências s3:// em vez das imagens
+            user_input = self._ingest_images(user_input, session, allow_local_paths=allow_local_paths)
+            
+            # Invocar agente
+            with metrics.span('bedrock.invoke_agent'):
+                response = self.bedrock_runtime.invoke_agent(
+                    agentId=self.agent_id,
+                    agentAliasId=self.agent_alias_id,
+                    sessionId=session.session_id,
+                    inputText=user_input,
+                    streamingConfigurations=STREAMING_CONFIGURATIONS
+                )
+            
+            # Processar resposta, incluindo as continuações após as ferramentas
+            yield from self._stream_events(response['completion'], session)
             
         except Exception as e:
-            return f"Erro na conversa: {str(e)}"
+            yield {'type': 'error', 'message': f"Erro na conversa: {str(e)}"}
+    
+    def chat(self, user_input: str, session: Optional[ValidationSession] = None,
+             allow_local_paths: bool = False) -> str:
+        """Interface de chat com o agente"""
+        result = []
+        for event in self.chat_stream(user_input, session, allow_local_paths):
+            if event['type'] == 'text':
+                result.append(event['text'])
+            elif event['type'] == 'error':
+                return event['message']
+        return ''.join(result)
 
 def main():
     """Função principal"""
@@ -285,14 +368,29 @@ def main():
     # Criar instância do agente
     agent = DocumentValidationAgent()
     
-    # Opção para usar agente existente ou criar novo
-    use_existing = input("Usar agente existente? (s/n): ").lower() == 's'
+    # Modo servidor HTTP: python main.py serve [host] [porta]
+    if sys.argv[1:2] == ['serve']:
+        from server import serve
+        
+        # Ids explícitos ou provisionamento idempotente (cache local / busca pelo nome)
+        agent.agent_id = os.environ.get('BEDROCK_AGENT_ID')
+        agent.agent_alias_id = os.environ.get('BEDROCK_AGENT_ALIAS_ID')
+        if agent.mode == 'agent' and not (agent.agent_id and agent.agent_alias_id):
+            agent.create_agent()
+        host = sys.argv[2] if len(sys.argv) > 2 else '127.0.0.1'
+        port = int(sys.argv[3]) if len(sys.argv) > 3 else 8080
+        serve(agent, host, port)
+        return
     
-    if use_existing:
-        agent.agent_id = input("Digite o ID do agente: ")
-        agent.agent_alias_id = input("Digite o ID do alias: ")
-    else:
-        agent.create_agent()
+    # Opção para usar agente existente ou criar novo (o modo orquestrador não usa o agente)
+    if agent.mode == 'agent':
+        use_existing = input("Usar agente existente? (s/n): ").lower() == 's'
+        
+        if use_existing:
+            agent.agent_id = input("Digite o ID do agente: ")
+            agent.agent_alias_id = input("Digite o ID do alias: ")
+        else:
+            agent.create_agent()
     
     print("\n" + "="*50)
     print("AGENTE DE VALIDAÇÃO DE DOCUMENTOS")
@@ -307,10 +405,21 @@ def main():
         if user_input.lower() in ['sair', 'exit', 'quit']:
             break
         
-        print("Agente: ", end="")
-        response = agent.chat(user_input)
-        print(response)
+        print("Agente: ", end="", flush=True)
+        # Terminal local: caminhos de arquivo na mensagem são lidos do disco
+        for event in agent.chat_stream(user_input, allow_local_paths=True):
+            if event['type'] == 'text':
+                print(event['text'], end="", flush=True)
+            elif event['type'] == 'tool_start':
+                print(f"\n[executando: {', '.join(event['tools'])}]", flush=True)
+            elif event['type'] == 'error':
+                print(event['message'], end="")
         print()
+        print()
+    
+    # Concluir uploads de auditoria pendentes (pipeline em memória)
+    image_store.wait_for_uploads()
+    metrics.write_prometheus()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
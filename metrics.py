@@ -0,0 +1,208 @@
+import functools
+import json
+import logging
+import os
+import statistics
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, Callable, List, Optional
+
+# Instrumentação das ferramentas: spans de tempo em volta das chamadas AWS e das etapas
+# de parsing, histogramas por span/ferramenta e contadores de erro por tipo.
+# Exportação: logs JSON estruturados (logger document_validation.metrics), texto no
+# formato Prometheus (render_prometheus / METRICS_PROMETHEUS_FILE) e, opcionalmente,
+# um bloco _timings em cada resposta de ferramenta.
+# Desligado (padrão), span() devolve um contexto vazio compartilhado.
+
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '0') == '1'
+LOG_SPANS = os.environ.get('METRICS_LOG_SPANS', '0') == '1'
+TOOL_TIMINGS = os.environ.get('METRICS_TOOL_TIMINGS', '0') == '1'
+PROMETHEUS_FILE = os.environ.get('METRICS_PROMETHEUS_FILE')
+
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, float('inf'))
+
+logger = logging.getLogger('document_validation.metrics')
+if LOG_SPANS and not logger.handlers:
+    # Uma linha JSON por span/erro em stderr; a aplicação pode trocar o handler deste logger
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+_lock = threading.Lock()
+_histograms: Dict[str, List[float]] = {}
+_sums: Dict[str, float] = {}
+_errors: Dict[tuple, int] = {}
+_local = threading.local()
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+def observe(name: str, duration_ms: float) -> None:
+    """Registra uma duração no histograma do span"""
+    with _lock:
+        counts = _histograms.get(name)
+        if counts is None:
+            counts = _histograms[name] = [0] * len(BUCKETS_MS)
+            _sums[name] = 0.0
+        for i, bound in enumerate(BUCKETS_MS):
+            if duration_ms <= bound:
+                counts[i] += 1
+                break
+        _sums[name] += duration_ms
+
+
+def record_error(tool: str, error_type: str) -> None:
+    """Conta um erro da ferramenta pelo tipo (código da AWS ou nome da exceção)"""
+    if not METRICS_ENABLED:
+        return
+    with _lock:
+        _errors[(tool, error_type)] = _errors.get((tool, error_type), 0) + 1
+    _local.error_recorded = True
+    if LOG_SPANS:
+        logger.info(json.dumps({'event': 'error', 'tool': tool, 'error_type': error_type}))
+
+
+def error_type(error: Exception) -> str:
+    """Código de erro da AWS (ClientError) ou o nome da exceção"""
+    response = getattr(error, 'response', None)
+    if isinstance(response, dict) and response.get('Error', {}).get('Code'):
+        return response['Error']['Code']
+    return type(error).__name__
+
+
+@contextmanager
+def _span(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration_ms = (time.perf_counter() - start) * 1000
+        observe(name, duration_ms)
+        timings = getattr(_local, 'timings', None)
+        if timings is not None:
+            timings[name] = round(timings.get(name, 0.0) + duration_ms, 3)
+        if LOG_SPANS:
+            logger.info(json.dumps({'event': 'span', 'span': name, 'duration_ms': round(duration_ms, 3)}))
+
+
+def span(name: str):
+    """Contexto que mede o trecho (ex.: with span('textract.analyze_document'): ...)"""
+    if not METRICS_ENABLED:
+        return _NOOP
+    return _span(name)
+
+
+def instrument_tool(tool: str) -> Callable:
+    """
+    Decorador das funções de ferramenta: mede o total, coleta os spans internos
+    da thread e conta respostas de erro
+    """
+    def decorator(func: Callable[..., Dict[str, Any]]):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs) -> Dict[str, Any]:
+            if not METRICS_ENABLED:
+                return func(*args, **kwargs)
+
+            # Ferramentas chamadas por outras (ex.: get_face_details no recorte da face)
+            outer = getattr(_local, 'timings', None)
+            outer_error = getattr(_local, 'error_recorded', False)
+            _local.timings = timings = {}
+            _local.error_recorded = False
+            try:
+                with _span(f'tool.{tool}'):
+                    result = func(*args, **kwargs)
+            finally:
+                error_recorded = _local.error_recorded
+                _local.timings = outer
+                _local.error_recorded = outer_error
+                if outer is not None:
+                    for name, duration_ms in timings.items():
+                        outer[name] = round(outer.get(name, 0.0) + duration_ms, 3)
+
+            response = result.get('response', {})
+            if 'error' in response and not error_recorded:
+                # Erros de validação de parâmetros (sem exceção)
+                record_error(tool, 'InvalidParameters')
+                _local.error_recorded = outer_error
+            if TOOL_TIMINGS:
+                response['_timings'] = timings
+            return result
+        return wrapper
+    return decorator
+
+
+def render_prometheus() -> str:
+    """Métricas no formato texto do Prometheus"""
+    lines = [
+        '# HELP document_validation_span_duration_ms Duração dos spans e ferramentas em ms',
+        '# TYPE document_validation_span_duration_ms histogram'
+    ]
+    with _lock:
+        for name in sorted(_histograms):
+            cumulative = 0
+            for bound, count in zip(BUCKETS_MS, _histograms[name]):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else str(bound)
+                lines.append(f'document_validation_span_duration_ms_bucket{{span="{name}",le="{le}"}} {cumulative}')
+            lines.append(f'document_validation_span_duration_ms_sum{{span="{name}"}} {_sums[name]:.3f}')
+            lines.append(f'document_validation_span_duration_ms_count{{span="{name}"}} {cumulative}')
+
+        lines.append('# HELP document_validation_errors_total Erros por ferramenta e tipo')
+        lines.append('# TYPE document_validation_errors_total counter')
+        for (tool, kind), count in sorted(_errors.items()):
+            lines.append(f'document_validation_errors_total{{tool="{tool}",type="{kind}"}} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+def write_prometheus(path: Optional[str] = None) -> None:
+    """Grava as métricas em arquivo (para o textfile collector do node_exporter)"""
+    path = path or PROMETHEUS_FILE
+    if not path:
+        return
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(render_prometheus())
+    os.replace(tmp_path, path)
+
+
+def snapshot() -> Dict[str, Any]:
+    """Métricas atuais como dicionário (contagem, soma e média por span; erros)"""
+    with _lock:
+        return {
+            'spans': {
+                name: {
+                    'count': sum(counts),
+                    'sum_ms': round(_sums[name], 3),
+                    'avg_ms': round(_sums[name] / sum(counts), 3) if sum(counts) else 0.0
+                }
+                for name, counts in _histograms.items()
+            },
+            'errors': {f'{tool}:{kind}': count for (tool, kind), count in _errors.items()}
+        }
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """p50, p95 e p99 de uma lista de latências (benchmarks, lote e teste de carga)"""
+    if not samples:
+        return {'p50': 0.0, 'p95': 0.0, 'p99': 0.0}
+    cuts = statistics.quantiles(samples, n=100) if len(samples) > 1 else samples * 99
+    return {'p50': round(cuts[49], 3), 'p95': round(cuts[94], 3), 'p99': round(cuts[98], 3)}
+
+
+def reset() -> None:
+    with _lock:
+        _histograms.clear()
+        _sums.clear()
+        _errors.clear()
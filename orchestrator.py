@@ -0,0 +1,197 @@
+import os
+from typing import Dict, Any, Iterator, List, Optional
+
+from aws_clients import get_client
+
+# Modo orquestrador (AGENT_MODE=orchestrator): o fluxo fixo documento -> extração ->
+# selfie -> comparação -> resultado roda como uma máquina de estados local, chamando as
+# ferramentas diretamente, sem invoke_agent por etapa. O modelo é usado, no máximo,
+# para redigir as mensagens ao usuário (ORCHESTRATOR_MESSAGES=model); por padrão as
+# mensagens vêm de modelos fixos.
+#
+# Estados da sessão: awaiting_document -> [awaiting_document_photo, quando o documento é
+# PDF/TIFF sem página renderizada] -> awaiting_selfie -> done
+
+ORCHESTRATOR_MESSAGES = os.environ.get('ORCHESTRATOR_MESSAGES', 'template')
+MESSAGE_MODEL_ID = os.environ.get('ORCHESTRATOR_MODEL_ID', 'anthropic.claude-3-5-haiku-20241022-v1:0')
+
+TEMPLATES = {
+    'greeting': 'Olá! Para validar sua identidade, envie a foto de um documento com foto (RG, CNH, etc.).',
+    'rejected': 'A imagem foi recusada: {reason}',
+    'document_data': (
+        'Documento recebido. Dados extraídos:\n'
+        '- Nome: {nome}\n'
+        '- CPF: {cpf}\n'
+        '- Data de nascimento: {data_nascimento}'
+    ),
+    'ask_selfie': 'Agora envie uma selfie, de frente e com o rosto bem iluminado.',
+    'ask_document_photo': (
+        'O arquivo do documento (PDF/TIFF) não serve para a comparação facial. '
+        'Envie uma foto (JPG ou PNG) do documento com o retrato visível.'
+    ),
+    'document_error': 'Não consegui ler o documento: {error} Envie uma nova foto do documento.',
+    'selfie_error': 'Não consegui comparar a selfie com o documento: {error} Envie uma nova selfie.',
+    'validated': 'Validação concluída com sucesso! Similaridade de {similarity:.2f}% (mínimo de {threshold:.0f}%).',
+    'not_validated': (
+        'Validação não aprovada: similaridade de {similarity:.2f}% (mínimo de {threshold:.0f}%). '
+        'Envie uma nova selfie, de frente e com o rosto bem iluminado.'
+    ),
+    'done': 'A validação já foi concluída. Para validar outro documento, envie uma nova foto do documento.'
+}
+
+NOT_FOUND = 'não identificado'
+
+
+class ValidationOrchestrator:
+    """
+    Executa um turno da conversa sem o agente: recebe as imagens da mensagem, dispara
+    a extração assim que o documento chega e a comparação assim que há selfie
+    """
+
+    def __init__(self, agent):
+        # Reaproveita do agente a ingestão de imagens, as ferramentas e o pool de threads
+        self.agent = agent
+
+    def run(self, user_input: str, session, allow_local_paths: bool = False) -> Iterator[Dict[str, Any]]:
+        rejections: List[str] = []
+        had_document = session.document_s3_info is not None
+
+        if session.state == 'done':
+            # Nova imagem após a conclusão começa outra validação
+            previous = (session.document_s3_info, session.face_reference_s3_info, session.selfie_s3_info)
+            session.document_s3_info = session.face_reference_s3_info = session.selfie_s3_info = None
+            self.agent._ingest_images(user_input, session, rejections, allow_local_paths)
+            if session.document_s3_info is None:
+                session.document_s3_info, session.face_reference_s3_info, session.selfie_s3_info = previous
+                yield from self._say([TEMPLATES['rejected'].format(reason=reason) for reason in rejections], 'done')
+                return
+            session.state = 'awaiting_document'
+            had_document = False
+        else:
+            self.agent._ingest_images(user_input, session, rejections, allow_local_paths)
+
+        messages = [TEMPLATES['rejected'].format(reason=reason) for reason in rejections]
+        new_document = session.document_s3_info is not None and not had_document
+
+        if session.state == 'awaiting_document':
+            if not new_document:
+                yield from self._say(messages, 'greeting')
+                return
+
+            document = session.document_s3_info
+            reference = session.face_reference_s3_info
+            selfie = session.selfie_s3_info
+            if reference is not None and selfie is not None:
+                # Documento e selfie na mesma mensagem: extração e comparação em paralelo
+                yield {'type': 'tool_start', 'tools': ['extract_text_from_document', 'compare_faces']}
+                extraction_future = self.agent.tool_executor.submit(self._extract, document)
+                comparison = self._compare(reference, selfie)
+                extraction = extraction_future.result()
+                yield {'type': 'tool_end', 'tools': ['extract_text_from_document', 'compare_faces']}
+            else:
+                yield {'type': 'tool_start', 'tools': ['extract_text_from_document']}
+                extraction = self._extract(document)
+                comparison = None
+                yield {'type': 'tool_end', 'tools': ['extract_text_from_document']}
+
+            if 'error' in extraction:
+                session.document_s3_info = session.face_reference_s3_info = session.selfie_s3_info = None
+                messages.append(TEMPLATES['document_error'].format(error=extraction['error']))
+                yield from self._say(messages)
+                return
+
+            session.extraction = extraction
+            dados = extraction.get('extracted_data') or {}
+            messages.append(TEMPLATES['document_data'].format(
+                **{campo: dados.get(campo) or NOT_FOUND for campo in ('nome', 'cpf', 'data_nascimento')}
+            ))
+            if reference is None:
+                # PDF/TIFF sem página utilizável: a comparação facial precisa de uma foto do documento
+                session.state = 'awaiting_document_photo'
+                messages.append(TEMPLATES['ask_document_photo'])
+                yield from self._say(messages)
+                return
+            session.state = 'awaiting_selfie'
+            if comparison is None:
+                messages.append(TEMPLATES['ask_selfie'])
+                yield from self._say(messages)
+                return
+
+        elif session.state in ('awaiting_document_photo', 'awaiting_selfie'):
+            if session.face_reference_s3_info is None:
+                messages.append(TEMPLATES['ask_document_photo'])
+                yield from self._say(messages)
+                return
+            session.state = 'awaiting_selfie'
+            if session.selfie_s3_info is None or not self._new_selfie(session):
+                messages.append(TEMPLATES['ask_selfie'])
+                yield from self._say(messages)
+                return
+            yield {'type': 'tool_start', 'tools': ['compare_faces']}
+            comparison = self._compare(session.face_reference_s3_info, session.selfie_s3_info)
+            yield {'type': 'tool_end', 'tools': ['compare_faces']}
+
+        else:
+            yield from self._say(messages, 'done')
+            return
+
+        session.compared_selfie = session.selfie_s3_info
+        if 'error' in comparison:
+            messages.append(TEMPLATES['selfie_error'].format(error=comparison['error']))
+        elif comparison.get('validated'):
+            session.state = 'done'
+            messages.append(TEMPLATES['validated'].format(**comparison))
+        else:
+            messages.append(TEMPLATES['not_validated'].format(**comparison))
+
+        yield {
+            'type': 'validation',
+            'document': session.document_s3_info,
+            'selfie': session.selfie_s3_info,
+            'extracted_data': (session.extraction or {}).get('extracted_data'),
+            'validated': comparison.get('validated', False),
+            'similarity': comparison.get('similarity'),
+            'error': comparison.get('error')
+        }
+        yield from self._say(messages)
+
+    @staticmethod
+    def _new_selfie(session) -> bool:
+        return session.selfie_s3_info is not getattr(session, 'compared_selfie', None)
+
+    def _extract(self, document: Dict[str, str]) -> Dict[str, Any]:
+        return self.agent._execute_action('extract_text_from_document', 'extract_text_from_document', [
+            {'name': 'bucket', 'value': document['bucket']},
+            {'name': 'key', 'value': document['key']}
+        ])['response']
+
+    def _compare(self, document: Dict[str, str], selfie: Dict[str, str]) -> Dict[str, Any]:
+        return self.agent._execute_action('compare_faces', 'compare_faces', [
+            {'name': 'source_bucket', 'value': document['bucket']},
+            {'name': 'source_key', 'value': document['key']},
+            {'name': 'target_bucket', 'value': selfie['bucket']},
+            {'name': 'target_key', 'value': selfie['key']}
+        ])['response']
+
+    def _say(self, messages: List[str], template: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        if template:
+            messages = messages + [TEMPLATES[template]]
+        text = '\n\n'.join(messages)
+        if ORCHESTRATOR_MESSAGES == 'model':
+            text = self._phrase(text)
+        yield {'type': 'text', 'text': text}
+
+    def _phrase(self, text: str) -> str:
+        """Reescreve a mensagem com o modelo (uma chamada, sem ferramentas); modelo fixo em caso de falha"""
+        try:
+            response = get_client('bedrock-runtime').converse(
+                modelId=MESSAGE_MODEL_ID,
+                system=[{'text': 'Você é um assistente de validação de documentos. Reescreva a mensagem a seguir '
+                                 'para o usuário de forma clara e educada, em português, sem omitir nem '
+                                 'inventar informações.'}],
+                messages=[{'role': 'user', 'content': [{'text': text}]}],
+                inferenceConfig={'maxTokens': 400, 'temperature': 0.2}
+            )
+            return response['output']['message']['content'][0]['text']
+        except Exception:
+            return text
@@ -0,0 +1,262 @@
+import os
+import statistics
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, Any, Callable, Deque, Optional
+
+from botocore.exceptions import ClientError, ConnectionError as BotoConnectionError, HTTPClientError
+
+# Controle de latência de cauda das chamadas ao Textract e ao Rekognition:
+# - prazo (deadline) por ferramenta: a chamada é abandonada quando o prazo acaba;
+# - requisição de hedge opcional: uma segunda chamada idêntica é disparada se a
+#   primeira passar do percentil HEDGE_PERCENTILE das latências recentes;
+# - circuit breaker por serviço: após falhas transitórias seguidas, falha imediatamente
+#   durante CIRCUIT_COOLDOWN_S.
+# Retentativas com backoff e limitação adaptativa ficam com o botocore (retries
+# mode=adaptive em aws_clients).
+
+TOOL_DEADLINES = {
+    'textract': float(os.environ.get('TEXTRACT_DEADLINE_S', '20')),
+    'rekognition': float(os.environ.get('REKOGNITION_DEADLINE_S', '10'))
+}
+
+HEDGE_ENABLED = os.environ.get('HEDGE_ENABLED', '0') == '1'
+HEDGE_PERCENTILE = int(os.environ.get('HEDGE_PERCENTILE', '95'))
+HEDGE_MIN_SAMPLES = int(os.environ.get('HEDGE_MIN_SAMPLES', '20'))
+HEDGE_MIN_DELAY_MS = float(os.environ.get('HEDGE_MIN_DELAY_MS', '200'))
+HEDGE_DEFAULT_DELAY_MS = float(os.environ.get('HEDGE_DEFAULT_DELAY_MS', '2000'))
+
+CIRCUIT_BREAKER_ENABLED = os.environ.get('CIRCUIT_BREAKER_ENABLED', '1') == '1'
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get('CIRCUIT_FAILURE_THRESHOLD', '5'))
+CIRCUIT_COOLDOWN_S = float(os.environ.get('CIRCUIT_COOLDOWN_S', '30'))
+
+THROTTLING_CODES = {
+    'ThrottlingException',
+    'Throttling',
+    'ProvisionedThroughputExceededException',
+    'LimitExceededException',
+    'TooManyRequestsException',
+    'RequestLimitExceeded'
+}
+
+SERVICE_NAMES = {
+    'textract': 'Textract',
+    'rekognition': 'Rekognition'
+}
+
+# Chamadas com prazo ou hedge rodam neste pool; as abandonadas terminam em segundo plano
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('RESILIENCE_WORKERS', '32')),
+    thread_name_prefix='aws-call'
+)
+
+
+class DeadlineExceeded(TimeoutError):
+    """Prazo da ferramenta esgotado antes da resposta do serviço"""
+
+    def __init__(self, service: str, seconds: Optional[float]):
+        super().__init__(f'Prazo de {seconds:g}s excedido na chamada ao {SERVICE_NAMES.get(service, service)}')
+        self.service = service
+
+
+class CircuitOpenError(RuntimeError):
+    """Serviço marcado como degradado pelo circuit breaker"""
+
+    def __init__(self, service: str, retry_after: float):
+        super().__init__(f'{SERVICE_NAMES.get(service, service)} indisponível temporariamente '
+                         f'(nova tentativa em {retry_after:.0f}s)')
+        self.service = service
+        self.retry_after = retry_after
+
+
+class Deadline:
+    """Prazo absoluto de uma ferramenta, compartilhado por todas as chamadas dela"""
+
+    def __init__(self, seconds: Optional[float]):
+        self.seconds = seconds if seconds and seconds > 0 else None
+        self.expires = time.monotonic() + self.seconds if self.seconds else None
+
+    @classmethod
+    def for_service(cls, service: str) -> 'Deadline':
+        return cls(TOOL_DEADLINES.get(service))
+
+    def remaining(self) -> Optional[float]:
+        if self.expires is None:
+            return None
+        return self.expires - time.monotonic()
+
+
+class CircuitBreaker:
+    """
+    closed -> open após `threshold` falhas transitórias seguidas; open -> half_open
+    após `cooldown` segundos, liberando uma chamada de teste que fecha ou reabre o circuito
+    """
+
+    def __init__(self, service: str, threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 cooldown: float = CIRCUIT_COOLDOWN_S):
+        self.service = service
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def before_call(self) -> None:
+        with self._lock:
+            if self.state == 'closed':
+                return
+            elapsed = time.monotonic() - self.opened_at
+            if self.state == 'open' and elapsed >= self.cooldown:
+                self.state = 'half_open'
+                return
+            raise CircuitOpenError(self.service, max(0.0, self.cooldown - elapsed))
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.threshold:
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_latencies: Dict[str, Deque[float]] = {}
+_lock = threading.Lock()
+
+
+def get_breaker(service: str) -> CircuitBreaker:
+    breaker = _breakers.get(service)
+    if breaker is None:
+        with _lock:
+            breaker = _breakers.setdefault(service, CircuitBreaker(service))
+    return breaker
+
+
+def reset() -> None:
+    """Descarta o estado dos circuit breakers e o histórico de latências"""
+    with _lock:
+        _breakers.clear()
+        _latencies.clear()
+
+
+def is_transient(error: Exception) -> bool:
+    """Throttling, erro 5xx, falha de conexão ou prazo esgotado"""
+    if isinstance(error, (DeadlineExceeded, BotoConnectionError, HTTPClientError)):
+        return True
+    if isinstance(error, ClientError):
+        if error.response.get('Error', {}).get('Code') in THROTTLING_CODES:
+            return True
+        return error.response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0) >= 500
+    return False
+
+
+def is_throttling(error: Exception) -> bool:
+    return isinstance(error, ClientError) and error.response.get('Error', {}).get('Code') in THROTTLING_CODES
+
+
+def describe_error(service: str, error: Exception) -> Optional[str]:
+    """Mensagem específica para erros de latência/capacidade (None para os demais)"""
+    name = SERVICE_NAMES.get(service, service)
+    if isinstance(error, CircuitOpenError):
+        return f'{name} indisponível temporariamente. Tente novamente em {error.retry_after:.0f}s.'
+    if isinstance(error, DeadlineExceeded):
+        return f'Tempo limite excedido aguardando o {name}. Tente novamente.'
+    if is_throttling(error):
+        return f'{name} com limite de requisições excedido. Tente novamente em instantes.'
+    return None
+
+
+def _record_latency(operation: str, seconds: float) -> None:
+    samples = _latencies.get(operation)
+    if samples is None:
+        with _lock:
+            samples = _latencies.setdefault(operation, deque(maxlen=200))
+    samples.append(seconds)
+
+
+def hedge_delay(operation: str) -> float:
+    """Espera antes do hedge: percentil das latências recentes (ou o valor padrão)"""
+    samples = list(_latencies.get(operation, ()))
+    if len(samples) < HEDGE_MIN_SAMPLES:
+        return HEDGE_DEFAULT_DELAY_MS / 1000
+    cut = statistics.quantiles(samples, n=100)[HEDGE_PERCENTILE - 1]
+    return max(cut, HEDGE_MIN_DELAY_MS / 1000)
+
+
+def call(service: str, operation: str, func: Callable[[], Any],
+         deadline: Optional[Deadline] = None, hedge: bool = False) -> Any:
+    """
+    Executa func (a chamada ao cliente) respeitando o circuit breaker do serviço,
+    o prazo e, para chamadas idempotentes com hedge=True, a requisição de hedge
+    """
+    breaker = get_breaker(service) if CIRCUIT_BREAKER_ENABLED else None
+    if breaker is not None:
+        breaker.before_call()
+
+    def timed() -> Any:
+        start = time.perf_counter()
+        result = func()
+        _record_latency(operation, time.perf_counter() - start)
+        return result
+
+    try:
+        if (deadline is None or deadline.expires is None) and not (hedge and HEDGE_ENABLED):
+            result = timed()
+        else:
+            result = _call_bounded(service, operation, timed, deadline, hedge and HEDGE_ENABLED)
+    except Exception as e:
+        if breaker is not None:
+            if is_transient(e):
+                breaker.record_failure()
+            else:
+                # Erro do cliente (ex.: imagem inválida): o serviço está respondendo
+                breaker.record_success()
+        raise
+
+    if breaker is not None:
+        breaker.record_success()
+    return result
+
+
+def _call_bounded(service: str, operation: str, func: Callable[[], Any],
+                  deadline: Optional[Deadline], hedge: bool) -> Any:
+    def remaining() -> Optional[float]:
+        return deadline.remaining() if deadline is not None else None
+
+    timeout = remaining()
+    if timeout is not None and timeout <= 0:
+        raise DeadlineExceeded(service, deadline.seconds)
+
+    pending = {_executor.submit(func)}
+    if hedge:
+        delay = hedge_delay(operation)
+        done, _ = wait(pending, timeout=delay if timeout is None else min(delay, timeout))
+        timeout = remaining()
+        if not done and (timeout is None or timeout > 0):
+            pending.add(_executor.submit(func))
+
+    # Primeira resposta bem-sucedida vence; erro só depois que todas falharem
+    error = None
+    while pending:
+        timeout = remaining()
+        if timeout is not None and timeout <= 0:
+            break
+        done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+            error = future.exception()
+
+    if error is not None and not pending:
+        raise error
+    raise DeadlineExceeded(service, deadline.seconds)
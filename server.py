@@ -0,0 +1,272 @@
+import json
+import os
+import re
+import signal
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, Optional, Tuple
+
+import image_store
+import metrics
+from main import DocumentValidationAgent, ValidationSession
+
+# Servidor HTTP do agente de validação (python main.py serve).
+#
+#   POST   /sessions                 -> {"session_id": ...}
+#   POST   /sessions/<id>/messages   {"message": ...} -> {"response": ...}
+#   POST   /sessions/<id>/stream     {"message": ...} -> eventos NDJSON (chat_stream)
+#   DELETE /sessions/<id>
+#   GET    /health
+#   GET    /metrics                  -> texto no formato Prometheus (METRICS_ENABLED=1)
+#
+# Os clientes AWS vêm do registro compartilhado (aws_clients), aquecidos entre requisições.
+# Para testes locais, registre clientes com Stubber via aws_clients.set_client antes de
+# criar o DocumentValidationAgent.
+#
+# Mensagens chegam da rede: apenas imagens embutidas (data URLs) são aceitas; caminhos de
+# arquivo locais citados na mensagem nunca são lidos (allow_local_paths desligado).
+# Sessões sem uso há mais de SERVER_SESSION_IDLE_TTL segundos expiram ao criar novas sessões.
+
+MAX_CONCURRENCY = int(os.environ.get('SERVER_MAX_CONCURRENCY', '32'))
+MAX_PENDING = int(os.environ.get('SERVER_MAX_PENDING', '256'))
+# Limite do corpo das requisições (mensagens trazem imagens em base64)
+MAX_BODY_BYTES = int(os.environ.get('SERVER_MAX_BODY_BYTES', str(32 * 1024 * 1024)))
+SESSION_IDLE_TTL = float(os.environ.get('SERVER_SESSION_IDLE_TTL', '3600'))
+SESSION_SWEEP_INTERVAL = float(os.environ.get('SERVER_SESSION_SWEEP_INTERVAL', '60'))
+
+SESSION_PATH = re.compile(r'^/sessions/([\w-]+)(?:/(messages|stream))?$')
+
+
+class SessionPool:
+    """Sessões ativas, com lock por sessão e fila limitada de turnos"""
+    def __init__(self, max_concurrency: int = MAX_CONCURRENCY, max_pending: int = MAX_PENDING,
+                 idle_ttl: float = SESSION_IDLE_TTL):
+        self.max_pending = max_pending
+        self.idle_ttl = idle_ttl
+        self.sessions: Dict[str, ValidationSession] = {}
+        self.pending = 0
+        self.accepting = True
+
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._session_locks: Dict[str, threading.Lock] = {}
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._last_sweep = time.time()
+
+    def create(self) -> ValidationSession:
+        session = ValidationSession()
+        with self._lock:
+            if time.time() - self._last_sweep >= SESSION_SWEEP_INTERVAL:
+                self._expire_idle()
+            self.sessions[session.session_id] = session
+            self._session_locks[session.session_id] = threading.Lock()
+        return session
+
+    def close(self, session_id: str) -> bool:
+        with self._lock:
+            self._session_locks.pop(session_id, None)
+            return self.sessions.pop(session_id, None) is not None
+
+    def expire_idle(self) -> int:
+        """Remove sessões sem uso há mais de idle_ttl segundos (clientes que não enviam DELETE)"""
+        with self._lock:
+            return self._expire_idle()
+
+    def _expire_idle(self) -> int:
+        self._last_sweep = time.time()
+        limit = self._last_sweep - self.idle_ttl
+        expired = [
+            session_id for session_id, session in self.sessions.items()
+            if session.last_used < limit and not self._session_locks[session_id].locked()
+        ]
+        for session_id in expired:
+            del self.sessions[session_id]
+            del self._session_locks[session_id]
+        return len(expired)
+
+    def acquire(self, session_id: str) -> Optional[Tuple[ValidationSession, threading.Lock]]:
+        """
+        Reserva um lugar na fila para um turno da sessão. Retorna None se a fila
+        estiver cheia ou o servidor estiver encerrando; levanta KeyError se a sessão não existir.
+        """
+        with self._lock:
+            session = self.sessions[session_id]
+            if not self.accepting or self.pending >= self.max_pending:
+                return None
+            self.pending += 1
+            # Turno reservado conta como uso: a sessão não expira enquanto aguarda o lock
+            session.last_used = time.time()
+            return session, self._session_locks[session_id]
+
+    def run(self, session_lock: threading.Lock, turn) -> Any:
+        """Executa o turno respeitando o lock da sessão e o limite de concorrência"""
+        try:
+            with session_lock, self._slots:
+                return turn()
+        finally:
+            with self._lock:
+                self.pending -= 1
+                self._idle.notify_all()
+
+    def drain(self, timeout: Optional[float] = None) -> None:
+        """Para de aceitar turnos e aguarda os que estão em andamento"""
+        with self._lock:
+            self.accepting = False
+            self._idle.wait_for(lambda: self.pending == 0, timeout)
+
+
+class AgentRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    # Definidos por create_server
+    agent: DocumentValidationAgent = None
+    pool: SessionPool = None
+
+    def log_message(self, format, *args):
+        if os.environ.get('SERVER_ACCESS_LOG', '0') == '1':
+            super().log_message(format, *args)
+
+    def _send_json(self, status: int, body: Dict[str, Any]) -> None:
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_json(self) -> Optional[Dict[str, Any]]:
+        """Corpo JSON da requisição (objeto); se inválido, responde 400/413 e retorna None"""
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self._send_json(400, {'error': 'Content-Length inválido'})
+            return None
+        if length > MAX_BODY_BYTES:
+            # Corpo não lido: a conexão não pode ser reaproveitada
+            self.close_connection = True
+            self._send_json(413, {'error': f'Corpo da requisição acima de {MAX_BODY_BYTES} bytes'})
+            return None
+        if not length:
+            return {}
+        try:
+            body = json.loads(self.rfile.read(length))
+        except ValueError:
+            body = None
+        if not isinstance(body, dict):
+            self._send_json(400, {'error': 'JSON inválido: esperado um objeto'})
+            return None
+        return body
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._send_json(200, {
+                'status': 'ok' if self.pool.accepting else 'draining',
+                'sessions': len(self.pool.sessions),
+                'pending': self.pool.pending
+            })
+        elif self.path == '/metrics':
+            data = metrics.render_prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        else:
+            self._send_json(404, {'error': 'Rota não encontrada'})
+
+    def do_DELETE(self):
+        match = SESSION_PATH.match(self.path)
+        if not match or match.group(2):
+            self._send_json(404, {'error': 'Rota não encontrada'})
+        elif self.pool.close(match.group(1)):
+            self._send_json(200, {'session_id': match.group(1), 'closed': True})
+        else:
+            self._send_json(404, {'error': 'Sessão não encontrada'})
+
+    def do_POST(self):
+        if self.path == '/sessions':
+            if self._read_json() is None:
+                return
+            session = self.pool.create()
+            self._send_json(201, {'session_id': session.session_id})
+            return
+
+        match = SESSION_PATH.match(self.path)
+        if not match or not match.group(2):
+            self._send_json(404, {'error': 'Rota não encontrada'})
+            return
+
+        body = self._read_json()
+        if body is None:
+            return
+        message = body.get('message')
+        if not isinstance(message, str) or not message:
+            self._send_json(400, {'error': 'Campo message é obrigatório (texto)'})
+            return
+
+        try:
+            reserved = self.pool.acquire(match.group(1))
+        except KeyError:
+            self._send_json(404, {'error': 'Sessão não encontrada'})
+            return
+        if reserved is None:
+            self._send_json(503, {'error': 'Servidor ocupado ou encerrando; tente novamente'})
+            return
+
+        session, session_lock = reserved
+        if match.group(2) == 'messages':
+            response = self.pool.run(session_lock, lambda: self.agent.chat(message, session))
+            self._send_json(200, {'session_id': session.session_id, 'response': response})
+        else:
+            self.pool.run(session_lock, lambda: self._stream(message, session))
+
+    def _stream(self, message: str, session: ValidationSession) -> None:
+        """Envia os eventos de chat_stream como NDJSON em chunked transfer encoding"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        for event in self.agent.chat_stream(message, session):
+            data = (json.dumps(event) + '\n').encode('utf-8')
+            self.wfile.write(f'{len(data):X}\r\n'.encode('ascii') + data + b'\r\n')
+            self.wfile.flush()
+        self.wfile.write(b'0\r\n\r\n')
+
+
+def create_server(agent: DocumentValidationAgent, host: str = '127.0.0.1', port: int = 8080,
+                  pool: Optional[SessionPool] = None) -> ThreadingHTTPServer:
+    handler = type('Handler', (AgentRequestHandler,), {
+        'agent': agent,
+        'pool': pool or SessionPool()
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def serve(agent: DocumentValidationAgent, host: str = '127.0.0.1', port: int = 8080) -> None:
+    """
+    Executa o servidor até SIGINT/SIGTERM; no encerramento, para de aceitar turnos,
+    aguarda os que estão em andamento e conclui os uploads pendentes
+    """
+    server = create_server(agent, host, port)
+    pool = server.RequestHandlerClass.pool
+
+    def stop(signum, frame):
+        threading.Thread(target=server.shutdown).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    print(f"Servidor do agente em http://{host}:{port}")
+    server.serve_forever()
+
+    pool.drain(timeout=float(os.environ.get('SERVER_DRAIN_TIMEOUT', '30')))
+    server.server_close()
+    image_store.wait_for_uploads()
+    metrics.write_prometheus()
+    print("Servidor encerrado")
@@ -0,0 +1,178 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple, List
+
+import image_store
+from aws_clients import get_client
+
+# Cache de resultados do Textract, indexado por (bucket, key, ETag/versão, features).
+# Camada 1: LRU em memória. Camada 2 (opcional): SQLite em disco com TTL e limite de tamanho.
+
+CONTENT_ADDRESSED_PREFIX = 'images/sha256/'
+
+# Versões (VersionId/ETag) dos objetos gravados por este processo, registradas no PUT
+VERSIONS_MAX = int(os.environ.get('TEXTRACT_CACHE_VERSIONS_MAX', '4096'))
+
+_versions: 'OrderedDict[Tuple[str, str], str]' = OrderedDict()
+_versions_lock = threading.Lock()
+
+
+def remember_version(bucket: str, key: str, put_response: Dict[str, Any]) -> None:
+    """Registra a versão retornada pelo put_object (a mesma que o head_object devolveria)"""
+    version = put_response.get('VersionId') or put_response.get('ETag', '').strip('"')
+    if not version:
+        return
+    with _versions_lock:
+        _versions[(bucket, key)] = version
+        _versions.move_to_end((bucket, key))
+        while len(_versions) > VERSIONS_MAX:
+            _versions.popitem(last=False)
+
+
+def object_version(bucket: str, key: str) -> str:
+    """
+    Identifica a versão do objeto. Chaves endereçadas por conteúdo são imutáveis,
+    imagens do pipeline em memória usam o próprio hash, objetos gravados por este
+    processo usam a versão registrada no PUT; só os demais usam VersionId ou ETag
+    via head_object.
+    """
+    if key.startswith(CONTENT_ADDRESSED_PREFIX):
+        return key[len(CONTENT_ADDRESSED_PREFIX):].split('.')[0]
+
+    digest = image_store.get_digest(bucket, key)
+    if digest is not None:
+        return digest
+
+    with _versions_lock:
+        version = _versions.get((bucket, key))
+    if version is not None:
+        return version
+
+    image_store.wait_for_upload(bucket, key)
+    head = get_client('s3').head_object(Bucket=bucket, Key=key)
+    return head.get('VersionId') or head['ETag'].strip('"')
+
+
+class TextractCache:
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 3600,
+                 db_path: Optional[str] = None, max_db_bytes: int = 256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_db_bytes = max_db_bytes
+        self.hits = 0
+        self.misses = 0
+
+        self._memory: 'OrderedDict[str, Tuple[float, Dict[str, Any]]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS entries ('
+                'key TEXT PRIMARY KEY, value BLOB, size INTEGER, created REAL, accessed REAL)'
+            )
+            self._db.commit()
+
+    @staticmethod
+    def make_key(bucket: str, key: str, version: str, feature_types: List[str]) -> str:
+        return json.dumps([bucket, key, version, sorted(feature_types)])
+
+    def get(self, cache_key: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """
+        Retorna (resultado, camada) ou (None, None) em caso de miss
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(cache_key)
+            if entry is not None:
+                if now - entry[0] < self.ttl_seconds:
+                    self._memory.move_to_end(cache_key)
+                    self.hits += 1
+                    return entry[1], 'memory'
+                del self._memory[cache_key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    'SELECT value, created FROM entries WHERE key = ?', (cache_key,)
+                ).fetchone()
+                if row is not None and now - row[1] < self.ttl_seconds:
+                    self._db.execute('UPDATE entries SET accessed = ? WHERE key = ?', (now, cache_key))
+                    self._db.commit()
+                    value = json.loads(row[0])
+                    self._remember(cache_key, row[1], value)
+                    self.hits += 1
+                    return value, 'disk'
+
+            self.misses += 1
+            return None, None
+
+    def put(self, cache_key: str, value: Dict[str, Any]) -> None:
+        now = time.time()
+        with self._lock:
+            self._remember(cache_key, now, value)
+
+            if self._db is not None:
+                blob = json.dumps(value).encode('utf-8')
+                self._db.execute(
+                    'INSERT OR REPLACE INTO entries (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)',
+                    (cache_key, blob, len(blob), now, now)
+                )
+                self._evict(now)
+                self._db.commit()
+
+    def stats(self, tier: Optional[str]) -> Dict[str, Any]:
+        return {
+            'hit': tier is not None,
+            'tier': tier,
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+    def _remember(self, cache_key: str, created: float, value: Dict[str, Any]) -> None:
+        self._memory[cache_key] = (created, value)
+        self._memory.move_to_end(cache_key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _evict(self, now: float) -> None:
+        """Remove entradas expiradas e, acima do limite de tamanho, as menos acessadas"""
+        self._db.execute('DELETE FROM entries WHERE created < ?', (now - self.ttl_seconds,))
+        total = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        if total <= self.max_db_bytes:
+            return
+
+        for key, size in self._db.execute('SELECT key, size FROM entries ORDER BY accessed').fetchall():
+            self._db.execute('DELETE FROM entries WHERE key = ?', (key,))
+            total -= size
+            if total <= self.max_db_bytes:
+                break
+
+
+_cache: Optional[TextractCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_textract_cache() -> Optional[TextractCache]:
+    """
+    Cache compartilhado pelo processo, configurado por variáveis de ambiente.
+    Retorna None quando TEXTRACT_CACHE_ENABLED=0.
+    """
+    global _cache
+    if os.environ.get('TEXTRACT_CACHE_ENABLED', '1') != '1':
+        return None
+
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = TextractCache(
+                    max_entries=int(os.environ.get('TEXTRACT_CACHE_MAX_ENTRIES', '256')),
+                    ttl_seconds=float(os.environ.get('TEXTRACT_CACHE_TTL', '3600')),
+                    db_path=os.environ.get('TEXTRACT_CACHE_PATH'),
+                    max_db_bytes=int(os.environ.get('TEXTRACT_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+                )
+    return _cache
@@ -0,0 +1,165 @@
+import collections
+from typing import Dict, Any, Callable, List, Optional, Union
+
+import metrics
+
+# Registro declarativo das ferramentas. Cada ferramenta é declarada uma única vez,
+# junto da função que a implementa, com parâmetros tipados:
+#
+#   @tool('get_face_details', 'Detecta faces em uma imagem',
+#         parameters=[Parameter('bucket', 'string', 'Bucket'), ...])
+#   def get_face_details(params) -> Dict[str, Any]:
+#       params.bucket ...
+#
+# A partir do registro são gerados os action groups do agente (functionSchema), o
+# roteamento (busca em dicionário pelo nome da função) e a conversão dos parâmetros
+# do evento, feita uma única vez, em uma namedtuple por ferramenta.
+
+CONVERTERS = {
+    'string': str,
+    'integer': int,
+    'number': float,
+    'boolean': lambda value: value if isinstance(value, bool) else str(value).lower() == 'true'
+}
+
+
+class Parameter:
+    """Parâmetro de uma ferramenta (tipos do functionSchema: string, integer, number, boolean)"""
+
+    def __init__(self, name: str, type: str = 'string', description: str = '',
+                 required: bool = True, default: Any = None):
+        if type not in CONVERTERS:
+            raise ValueError(f'Tipo de parâmetro não suportado: {type}')
+        self.name = name
+        self.type = type
+        self.description = description
+        self.required = required
+        self.default = default
+
+
+class Tool:
+    """Ferramenta registrada: metadados, tipo dos parâmetros e a função que a executa"""
+
+    def __init__(self, name: str, handler: Callable[..., Dict[str, Any]], description: str,
+                 parameters: List[Parameter], action_group_description: Optional[str] = None):
+        self.name = name
+        self.handler = handler
+        self.description = description
+        self.parameters = parameters
+        self.action_group_description = action_group_description or description
+        self.params_type = collections.namedtuple(f'{name}_params', [p.name for p in parameters])
+        self._by_name = {p.name: p for p in parameters}
+
+    def make(self, **values) -> Any:
+        """Parâmetros tipados a partir de argumentos nomeados (chamadas internas)"""
+        return self.parse(values)
+
+    def parse(self, raw: Union[List[Dict[str, Any]], Dict[str, Any]]) -> Any:
+        """
+        Converte os parâmetros do evento ([{'name', 'value'}] ou dicionário) em uma
+        namedtuple; ValueError para obrigatórios ausentes ou valores inválidos
+        """
+        if isinstance(raw, dict):
+            supplied = raw
+        else:
+            supplied = {item['name']: item.get('value') for item in raw}
+
+        values = {}
+        missing = []
+        for param in self.parameters:
+            value = supplied.get(param.name)
+            if value is None or value == '':
+                if param.required:
+                    missing.append(param.name)
+                values[param.name] = param.default
+                continue
+            try:
+                values[param.name] = CONVERTERS[param.type](value)
+            except (TypeError, ValueError):
+                raise ValueError(f'Parâmetro {param.name} inválido: esperado {param.type}')
+
+        if missing:
+            raise ValueError(f"Parâmetros obrigatórios ausentes: {', '.join(missing)}")
+        return self.params_type(**values)
+
+    def function_schema(self) -> Dict[str, Any]:
+        """Definição da função no formato do functionSchema do Bedrock"""
+        return {
+            'name': self.name,
+            'description': self.description,
+            'parameters': {
+                param.name: {
+                    'type': param.type,
+                    'description': param.description,
+                    'required': param.required
+                }
+                for param in self.parameters
+            }
+        }
+
+    def action_group(self, executor: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Parâmetros de create_agent_action_group para esta ferramenta"""
+        return {
+            'actionGroupName': self.name,
+            'description': self.action_group_description,
+            'actionGroupExecutor': executor or {'customControl': 'RETURN_CONTROL'},
+            'functionSchema': {'functions': [self.function_schema()]}
+        }
+
+    def __call__(self, event: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            params = self.parse(event.get('parameters', []))
+        except ValueError as e:
+            metrics.record_error(self.name, 'InvalidParameters')
+            return {
+                'response': {
+                    'error': str(e)
+                }
+            }
+        return self.handler(params)
+
+
+TOOLS: Dict[str, Tool] = {}
+
+
+def tool(name: str, description: str, parameters: List[Parameter],
+         action_group_description: Optional[str] = None) -> Callable:
+    """
+    Decorador que registra a função como ferramenta. A função recebe os parâmetros
+    tipados e é instrumentada (metrics.instrument_tool) uma única vez aqui.
+    """
+    def decorator(func: Callable[..., Dict[str, Any]]):
+        handler = metrics.instrument_tool(name)(func)
+        TOOLS[name] = Tool(name, handler, description, parameters, action_group_description)
+        return handler
+    return decorator
+
+
+def get_tool(name: str) -> Tool:
+    return TOOLS[name]
+
+
+def make_event(function: str, **params) -> Dict[str, Any]:
+    """Evento no formato enviado pelo Action Group (lote, benchmarks e testes)"""
+    return {
+        'actionGroup': function,
+        'function': function,
+        'parameters': [{'name': k, 'value': v} for k, v in params.items()]
+    }
+
+
+def dispatch(event: Dict[str, Any]) -> Dict[str, Any]:
+    """Executa a ferramenta indicada em event['function'] (evento do Action Group)"""
+    registered = TOOLS.get(event.get('function', ''))
+    if registered is None:
+        return {
+            'response': {
+                'error': 'Função não encontrada'
+            }
+        }
+    return registered(event)
+
+
+def action_groups(executor: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """Action groups de todas as ferramentas registradas, na ordem de registro"""
+    return [registered.action_group(executor) for registered in TOOLS.values()]